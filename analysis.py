@@ -0,0 +1,140 @@
+import numpy as np
+
+from biome import CellType
+from cell import Status
+from utils import distances
+
+
+class MapAnalyzer:
+    """Balance analysis of generated maps
+    """
+
+    """
+    Constants
+    """
+    GOLD_REACH_DIV = 6
+    TC_AREA_DIV = 12
+    BAND_CELLS = 256*256
+
+    def balance_metrics(self, generated):
+        """Calculate balance metrics of a generated map
+
+        Args:
+            generated (GeneratedMap): Generated map data
+
+        Returns:
+            dict: tc_distance: smallest distance between town centers, as a fraction of the map size.
+                gold_in_reach: number of gold mines within size/GOLD_REACH_DIV of every town center.
+                tc_water: fraction of the playable cells within size/TC_AREA_DIV of every town center that is water.
+        """
+        size = generated.size
+        tcs = generated.tc_pos
+
+        tc_dists = distances(tcs, tcs)
+        tc_dists[np.diag_indices(len(tcs))] = np.inf
+        gold_dists = distances(tcs, generated.gold_pos)
+
+        return {
+            "tc_distance": float(tc_dists.min() / size) if len(tcs) > 1 else None,
+            "gold_in_reach": (gold_dists <= size / self.GOLD_REACH_DIV).sum(axis=1).tolist(),
+            "tc_water": [self.water_fraction(generated, pos, size / self.TC_AREA_DIV) for pos in tcs.tolist()],
+        }
+
+    def resource_split(self, generated):
+        """Count the resources closest to every town center. Cells are counted in row bands, so memory mapped
+        layers of tiled maps are never loaded whole.
+
+        Args:
+            generated (GeneratedMap): Generated map data
+
+        Returns:
+            dict: Per town center lists of the number of forest cells, hunts, gold mines, treasures,
+                trade posts and water cells closest to it
+        """
+        no_tcs = len(generated.tc_pos)
+        forest = np.zeros(no_tcs, dtype=np.int64)
+        water = np.zeros(no_tcs, dtype=np.int64)
+        band_rows = max(1, self.BAND_CELLS // generated.size)
+        for y in range(0, generated.size, band_rows):
+            rows = slice(y, min(y + band_rows, generated.size))
+            owner = self.nearest_tc(generated, rows)
+            forest += np.bincount(owner[generated.biome_layer[rows] == CellType.forest.value.id], minlength=no_tcs)
+            water += np.bincount(owner[generated.status_layer[rows] == Status.WATER.value], minlength=no_tcs)
+        
+        def count_positions(coords):
+            owner = distances(coords, generated.tc_pos).argmin(axis=1)
+            return np.bincount(owner, minlength=no_tcs).tolist()
+        
+        return {
+            "forest": forest.tolist(),
+            "hunts": count_positions(generated.hunt_pos),
+            "gold": count_positions(generated.gold_pos),
+            "treasures": count_positions(generated.treasure_pos),
+            "trade_posts": count_positions(generated.trade_pos),
+            "water": water.tolist(),
+        }
+
+    def nearest_tc(self, generated, rows=None):
+        """Assign every cell to its closest town center, splitting the map in Voronoi regions
+
+        Args:
+            generated (GeneratedMap): Generated map data
+            rows (slice, optional): Rows to assign. Defaults to the whole map.
+
+        Returns:
+            np.ndarray: Array of shape (rows, size) with the index of the closest town center, ties go to the lowest index
+        """
+        rows = rows or slice(0, generated.size)
+        y, x = np.ogrid[rows, :generated.size]
+        owner = np.zeros((rows.stop - rows.start, generated.size), dtype=np.intp)
+        closest = None
+        for i, (tc_y, tc_x) in enumerate(generated.tc_pos.tolist()):
+            dists = (y - tc_y)**2 + (x - tc_x)**2
+            if closest is None:
+                closest = dists
+            else:
+                closer = dists < closest
+                owner[closer] = i
+                np.minimum(closest, dists, out=closest)
+        return owner
+
+    def passes(self, metrics, min_tc_dist=None, min_gold=None, max_water=None):
+        """Check balance metrics against thresholds. Thresholds set to None are not checked.
+
+        Args:
+            metrics (dict): Balance metrics from balance_metrics
+            min_tc_dist (float, optional): Minimum tc_distance. Defaults to None.
+            min_gold (int, optional): Minimum gold_in_reach of every town center. Defaults to None.
+            max_water (float, optional): Maximum tc_water of every town center. Defaults to None.
+
+        Returns:
+            bool: True if all thresholds are met
+        """
+        if min_tc_dist is not None and (metrics["tc_distance"] is None or metrics["tc_distance"] < min_tc_dist):
+            return False
+        if min_gold is not None and min(metrics["gold_in_reach"]) < min_gold:
+            return False
+        if max_water is not None and max(metrics["tc_water"]) > max_water:
+            return False
+        return True
+
+    def water_fraction(self, generated, pos, radius):
+        """Calculate the fraction of playable cells within radius of pos that is water
+
+        Args:
+            generated (GeneratedMap): Generated map data
+            pos (tuple): Coordinate
+            radius (float): Radius
+
+        Returns:
+            float: Water fraction
+        """
+        reach = int(np.ceil(radius))
+        y0, x0 = max(pos[0] - reach, 0), max(pos[1] - reach, 0)
+        window = generated.status_layer[y0:pos[0] + reach + 1, x0:pos[1] + reach + 1]
+
+        y, x = np.ogrid[y0:y0 + window.shape[0], x0:x0 + window.shape[1]]
+        disc = (y - pos[0])**2 + (x - pos[1])**2 <= radius**2
+        playable = disc & (window != Status.OOB.value)
+        water = playable & (window == Status.WATER.value)
+        return float(water.sum() / max(playable.sum(), 1))
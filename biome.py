@@ -1,5 +1,7 @@
 from enum import Enum
 
+import numpy as np
+
 
 class Color:
     """ RGBA Color class
@@ -28,6 +30,7 @@ class Biome:
         """
         self.color = color
         self.name = name
+        self.id = None
         
     def __str__(self):
         return self.name
@@ -63,7 +66,30 @@ class CellType(Enum):
     OOB = Biome(Color(0,0,0,0), "OOB")
 
 
+# Small integer ids for every biome, used to store biomes in compact uint8 map layers.
+# OOB comes first so that a zero-filled layer is out of bounds.
+BIOME_LIST = [CellType.OOB.value] + [t.value for t in CellType if t != CellType.OOB] + [b.value for b in Biomes]
+for biome_id, biome in enumerate(BIOME_LIST):
+    biome.id = biome_id
+del biome_id, biome
 
 
-    
+def get_biome(biome_id):
+    """Get a biome from its id
+
+    Args:
+        biome_id (int): Biome id
+
+    Returns:
+        Biome: Biome with the given id
+    """
+    return BIOME_LIST[biome_id]
+
 
+def get_palette():
+    """Get the RGBA palette of all biomes, indexed by biome id
+
+    Returns:
+        np.ndarray: Array of shape (len(BIOME_LIST), 4) with color values
+    """
+    return np.array([b.color.values for b in BIOME_LIST], dtype=np.uint8)
@@ -1,10 +1,11 @@
-from copy import deepcopy
+import os
 
 import numpy as np
 
 from biome import *
 from cell import *
-from utils import dist
+from placement_index import PlacementIndex
+from utils import chebyshev_distance_transform
 
 
 class MapType(Enum):
@@ -32,240 +33,325 @@ class Map:
     FOREST_MAX_NO = 60
     FISH_CHUNK_SIZE = 4
     HUNT_CHUNK_SIZE = 5
+    ROUTE_CHUNK_SIZE = 1024
+    TILE_SIZE = 256
     
-    def __init__(self, size, rand):
+    def __init__(self, size, tile_size=None, layer_dir=None):
         """Initializer
 
         Args:
             size (int): Size of the map
-            rand (np.random.RandomState): Numpy random class object
+            tile_size (int, optional): Size of the square tiles whole map operations are split into,
+                bounding their memory use. Defaults to None, processing the map as a single tile.
+            layer_dir (str, optional): Directory to store the layers in as memory mapped files. Defaults to None,
+                keeping the layers in memory.
         """
         self.size = size
-        self.rand = rand
-        self.cells = []
-        self.placements = []  
+        self.tile_size = tile_size if tile_size else size
+        self.layer_dir = layer_dir
+        self.biome_layer = None
+        self.status_layer = None
+        self.placements = []
+        # Per radius placement rasters cost a full layer each, tiled maps compute distances directly
+        self.placement_index = PlacementIndex(size, rasterize=tile_size is None)
+    
+    
+    def tiles(self):
+        """Iterate over the map in square tiles, in row-major order
+
+        Yields:
+            tuple: Pair of slices selecting the tile
+        """
+        for y in range(0, self.size, self.tile_size):
+            for x in range(0, self.size, self.tile_size):
+                yield np.s_[y:min(y + self.tile_size, self.size), x:min(x + self.tile_size, self.size)]
+    
+    
+    def bands(self):
+        """Iterate over the map in full width row bands of tile_size rows, from top to bottom
+
+        Yields:
+            tuple: Pair of slices selecting the band
+        """
+        for y in range(0, self.size, self.tile_size):
+            yield np.s_[y:min(y + self.tile_size, self.size), 0:self.size]
+    
+    
+    def band_rows(self):
+        """Get the number of rows of a full width band holding about as many cells as a tile. Bands never
+        hold more cells than a TILE_SIZE tile, so streamed operations stay bounded on untiled maps as well.
+
+        Returns:
+            int: Number of rows
+        """
+        tile_size = min(self.tile_size, self.TILE_SIZE)
+        return max(1, tile_size * tile_size // self.size)
+    
+    
+    def halo_window(self, window, margin):
+        """Grow a window by margin cells on every side, clipped to the map
+
+        Args:
+            window (tuple): Pair of slices selecting part of the map
+            margin (int): Number of cells to grow by
+
+        Returns:
+            tuple: Pair of slices selecting the grown window
+            tuple: Pair of slices selecting the original window within the grown window
+        """
+        outer = tuple(slice(max(s.start - margin, 0), min(s.stop + margin, self.size)) for s in window)
+        inner = tuple(slice(s.start - o.start, s.stop - o.start) for s, o in zip(window, outer))
+        return outer, inner
+    
+    
+    def new_layer(self, name, dtype):
+        """Allocate a zero filled map sized array, memory mapped in layer_dir if set
+
+        Args:
+            name (str): Layer name, used as file name
+            dtype (np.dtype): Data type of the layer
+
+        Returns:
+            np.ndarray: Array of shape (size, size)
+        """
+        if self.layer_dir is None:
+            return np.zeros((self.size, self.size), dtype=dtype)
+        return np.memmap(os.path.join(self.layer_dir, name + ".dat"), dtype=dtype, mode="w+", shape=(self.size, self.size))
     
     
     def set_biome(self, biome):
-        """Set main terrain biome and fill initial cells
+        """Set main terrain biome and fill the initial biome and status layers
 
         Args:
             biome (Biomes): Main terrain biome
         """
-        cells = []
-        
-        # Fill everything with main biome
-        for y in range(self.size):
-            row = []
-            for x in range(self.size):
-                row.append(Cell((y,x), biome))
-            cells.append(row)
-        
-        cells = np.array(cells)
+        self.biome_layer = self.new_layer("biome_layer", np.uint8)
+        self.status_layer = self.new_layer("status_layer", np.int8)
         
-        # Remove OOB cells
-        mask = self.create_circular_mask()
-        cells[~mask] = Cell((-1, -1), biome=CellType.OOB.value, status=Status.OOB)
-        
-        self.cells = cells
+        # Fill everything with main biome and remove OOB cells
+        for window in self.tiles():
+            mask = self.create_circular_mask(window)
+            self.biome_layer[window] = np.where(mask, biome.id, CellType.OOB.value.id)
+            self.status_layer[window] = np.where(mask, Status.EMPTY.value, Status.OOB.value)
     
         
-    def create_circular_mask(self):
+    def create_circular_mask(self, window=None):
         """Create a circular mask
 
+        Args:
+            window (tuple, optional): Pair of slices selecting the part of the map to get. Defaults to the whole map.
+
         Returns:
-            list: List of lists with bool values
+            np.ndarray: Boolean array of the window
         """
+        if window is None:
+            window = np.s_[0:self.size, 0:self.size]
         center = (int(self.size/2), int(self.size/2))
         radius = min(center[0], center[1], self.size-center[0], self.size-center[1])
         
-        y, x = np.ogrid[:self.size, :self.size]
+        y, x = np.ogrid[window]
         dist_from_center = np.sqrt((x - center[0])**2 + (y - center[1])**2)
         mask = dist_from_center <= radius
         return mask
     
     
-    def get_viable_cells(self, min_dist=0):
-        """Get a list of viable (empty) cells
+    def get_viable_mask(self, min_dist=0):
+        """Get the mask of viable (empty) cells
 
         Args:
             min_dist (int, optional): Exclude cells within dist of other placements. Defaults to 0.
 
         Returns:
-            list: List of coordinate tuples
+            np.ndarray: Boolean array of shape (size, size)
         """
-        coordinates = []
-        
-        
-        middle = self.size // 2, self.size // 2
-        for y in range(len(self.cells)):
-            for x in range(len(self.cells[y])):
-                cell = self.cells[y][x]
-                
-                # Check cell status and distance to middle
-                if cell.status != Status.OOB and cell.status != Status.WATER and dist(middle, (y,x)) < self.size // self.VIABLE_MIN_DIST_DIV:
-                    dist_to_buildings = [dist((y,x), val) for val in self.placements]
-                    
-                    # Check distance to other placements
-                    if all(val > min_dist for val in dist_to_buildings):
-                        coordinates.append((y,x))
-
-        return coordinates
-        
+        middle = self.size // 2
+        mask = self.new_layer("viable_mask", bool)
+        for window in self.tiles():
+            y, x = np.ogrid[window]
+            close_to_middle = np.sqrt((middle - y)**2 + (middle - x)**2) < self.size // self.VIABLE_MIN_DIST_DIV
+            
+            # Check cell status, distance to middle and distance to other placements
+            status = self.status_layer[window]
+            tile_mask = (status != Status.OOB.value) & (status != Status.WATER.value)
+            tile_mask &= close_to_middle & self.placement_index.far_mask(min_dist, window)
+            mask[window] = tile_mask
+        return mask
+    
+    
+    def nth_cell(self, mask, n):
+        """Get the coordinate of the n-th set cell of a mask in row-major order, without listing all set cells
+
+        Args:
+            mask (np.ndarray): Boolean array of shape (size, size)
+            n (int): Index of the cell
+
+        Returns:
+            tuple: Coordinate of the cell
+        """
+        row_counts = np.cumsum(np.count_nonzero(mask, axis=1))
+        row = int(np.searchsorted(row_counts, n, side="right"))
+        before = int(row_counts[row - 1]) if row > 0 else 0
+        return row, int(np.flatnonzero(mask[row])[n - before])
+    
+    
+    def mask_close_cells(self, mask, pos, min_dist):
+        """Clear all cells of a mask closer than min_dist to pos
+
+        Args:
+            mask (np.ndarray): Boolean array of shape (size, size), changed in place
+            pos (tuple): Coordinate
+            min_dist (float): Distance
+        """
+        for window in self.tiles():
+            y, x = np.ogrid[window]
+            dy, dx = y - pos[0], x - pos[1]
+            mask[window] &= np.sqrt(dy*dy + dx*dx) >= min_dist
     
     
     def get_viable_border_cells(self):
-        """Get list of viable (empty) border cells
+        """Get viable (empty) cells on the border of the playable region
 
         Returns:
-            list: List of coordinate tuples
+            np.ndarray: Array of shape (N, 2) with coordinates in row-major order
         """
-        coordinates = []
-        for y in range(len(self.cells)):
-            for x in range(len(self.cells[y])):
-                
-                if self.cells[y][x].status != Status.OOB:
-                    if self.cells[y][x].status == Status.EMPTY:
-                        coordinates.append((y,x))
-                    if self.cells[y][self.size-x-1].status == Status.EMPTY:
-                        coordinates.append((y,self.size - x))
-                    break
-                
-        return coordinates         
+        cells = []
+        for window in self.bands():
+            # Erosion needs the rows next to the band
+            outer, inner = self.halo_window(window, 1)
+            in_bounds = self.create_circular_mask(outer)
+            
+            # Erode the playable region by one cell, the border is what gets removed
+            padded = np.pad(in_bounds, 1, constant_values=False)
+            eroded = in_bounds & padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+            
+            border = in_bounds[inner] & ~eroded[inner] & (self.status_layer[window] == Status.EMPTY.value)
+            cells.append(np.argwhere(border) + (window[0].start, 0))
+        return np.concatenate(cells)
     
         
-    def get_values_array(self):
+    def get_values_array(self, window=None):
         """Get color values array of the map
 
+        Args:
+            window (tuple, optional): Pair of slices selecting the part of the map to get. Defaults to the whole map.
+
         Returns:
-            list: List of lists containing color quadruples
+            np.ndarray: Array of shape (height, width, 4) containing color quadruples
         """
-        color_values = np.zeros((self.size, self.size, 4), dtype=np.uint8)
-        for y in range(len(self.cells)):
-            for x in range(len(self.cells[y])):
-                values = self.cells[y][x].get_values()
-                color_values[y][x] = values
-                
-        return color_values
+        if window is None:
+            return get_palette()[self.biome_layer]
+        return get_palette()[self.biome_layer[window]]
     
     
-    def draw_trade_route(self, pos1, pos2):
-        """Draw trade route on the map
+    def route_line(self, pos1, pos2):
+        """Get the pixels of a trade route segment. The route steps diagonally towards
+        the end point and continues straight once one of the axes is aligned.
 
         Args:
             pos1 (tuple): Coordinate
             pos2 (tuple): Coordinate
+
+        Returns:
+            np.ndarray: Array of shape (N, 2) with segment pixels, excluding the start point
         """
         if pos1[0] < pos2[0]:
-            start = deepcopy(list(pos1))
-            end = list(pos2)
+            start, end = pos1, pos2
         else:
-            start = deepcopy(list(pos2))
-            end = list(pos1)
-            
-        while not np.array_equal(start, end):
-            if start[0] < end[0]:
-                start[0] += 1 
-            elif start[0] > end[0]:
-                start[0] -= 1
-                
-            if start[1] > end[1]:
-                start[1] -= 1
-            elif start[1] < end[1]:
-                start[1] += 1
-            
-            for i in range(self.ROUTE_WIDTH):
-                for j in range(self.ROUTE_WIDTH):
-                    self.set_cell_biome((start[0]+i, start[1]+j), CellType.traderoute.value)
-                    self.set_cell_biome((start[0]-i, start[1]-j), CellType.traderoute.value)   
+            start, end = pos2, pos1
+        
+        start = np.array(start, dtype=np.int64)
+        delta = np.array(end, dtype=np.int64) - start
+        steps = np.arange(1, np.abs(delta).max() + 1)[:, np.newaxis]
+        return start + np.sign(delta) * np.minimum(steps, np.abs(delta))
     
     
-    def close_to_biome(self, pos, biome, dist):
-        """Checks if pos is wihtin dist of a biome
+    def draw_trade_route(self, coords):
+        """Draw trade route on the map
 
         Args:
-            pos (tuple): Start coordinate
-            biome (Biome): Biome to search for
-            dist (int): Search distance
+            coords (list): Coordinates of the route points, connected in order
 
         Returns:
-            bool: True if biome was found, False if not.
+            np.ndarray: Array of shape (N, 2) with all trade route cells in row-major order
         """
-        for i in [-dist, dist]:
-            for j in range(-dist, dist):
-                if self.get_cell_biome((pos[0]+i, pos[1]+j)) == biome or self.get_cell_biome((pos[0]+j, pos[1]+i)) == biome:
-                    return True
-                   
-        return False
+        line = np.concatenate([self.route_line(coords[i], coords[i+1]) for i in range(len(coords) - 1)])
+        
+        # Brush covering offsets (i, j) and (-i, -j) for 0 <= i, j < ROUTE_WIDTH
+        width = self.ROUTE_WIDTH
+        kernel = np.zeros((2*width - 1, 2*width - 1), dtype=bool)
+        kernel[width-1:, width-1:] = True
+        kernel[:width, :width] = True
+        
+        # Stamp the route in chunks, so the coverage rasters stay small on large maps
+        chunks = [self.stamp(line[i:i + self.ROUTE_CHUNK_SIZE], kernel, CellType.traderoute.value)
+                  for i in range(0, len(line), self.ROUTE_CHUNK_SIZE)]
+        return np.unique(np.concatenate(chunks), axis=0)
     
     
-    def get_biome_coords(self, biome):
-        """Get a list of coordinates of a given biome
+    def biome_distance(self, biome):
+        """Get the distance field of a biome, to be computed once and queried for any part of the map.
+        The field is a map layer, so it is memory mapped on tiled maps.
 
         Args:
-            biome (Biome): Biome to check
+            biome (Biome): Biome to measure the distance to
 
         Returns:
-            list: List of biome coordinates
+            np.ndarray: int32 array with the Chebyshev distance from every cell to the nearest cell of the biome
         """
-        coordinates = []
-        
-        for y in range(len(self.cells)):
-            for x in range(len(self.cells[y])):
-                if self.get_cell_biome((y,x)) == biome:
-                    coordinates.append((y,x))
-        
-        return coordinates
-        
+        features = self.new_layer(biome.name + "_features", bool)
+        for window in self.bands():
+            features[window] = self.biome_layer[window] == biome.id
+        return chebyshev_distance_transform(features, self.new_layer(biome.name + "_distance", np.int32))
     
-    def place_tc(self, pos):
+    
+    def place_tc(self, pos, rand):
         """Place a towncenter on the map and generate starting mine and hunt
 
         Args:
             pos (tuple): Town center position
+            rand (np.random.RandomState): Random object of the placing stage to draw from
 
         Returns:
             tuple: coordinate of the gold mine
+            tuple: middle coordinate of the hunt
         """
         self.placements.append(pos)
+        self.placement_index.add(pos)
         
         # Get viable coordinates around TC
-        coordinates = []
         max_range = self.size // self.TC_MAX_RANGE_DIV
-        for y in range(pos[0] - max_range, pos[0] + max_range):
-            for x in range(pos[1] - max_range, pos[1] + max_range):
-                if self.get_cell_status((y,x)) == Status.EMPTY and dist(pos, (y,x)) > self.size / self.TC_MIN_DIST_DIV:
-                    coordinates.append((y,x))
+        y0, x0 = max(pos[0] - max_range, 0), max(pos[1] - max_range, 0)
+        window = np.s_[y0:min(pos[0] + max_range, self.size), x0:min(pos[1] + max_range, self.size)]
+        y, x = np.ogrid[window]
+        dy, dx = y - pos[0], x - pos[1]
+        viable = (self.status_layer[window] == Status.EMPTY.value) & (np.sqrt(dy*dy + dx*dx) > self.size / self.TC_MIN_DIST_DIV)
+        coordinates = np.argwhere(viable) + (y0, x0)
         
         # Place hunt and gold mine
-        rand_idx = self.rand.randint(0, len(coordinates))
-        gold_coord = coordinates[rand_idx]
-        hunt_coord = coordinates[-rand_idx]
+        rand_idx = rand.randint(0, len(coordinates))
+        gold_coord = tuple(coordinates[rand_idx].tolist())
+        hunt_coord = tuple(coordinates[-rand_idx].tolist())
         self.place_placement(gold_coord, Status.GOLD)
-        self.place_hunt(hunt_coord)
+        self.place_hunt(hunt_coord, rand)
             
         self.set_cell_status(pos, Status.TC)
-        return gold_coord
+        return gold_coord, hunt_coord
         
         
-    def place_forest(self, pos):
+    def place_forest(self, pos, rand):
         """Place forest on the map with pos coordinate as middle
 
         Args:
             pos (tuple): Forest middle coordinate
+            rand (np.random.RandomState): Random object of the placing stage to draw from
         """
-        distance = self.rand.randint(self.FOREST_MIN_DIST, self.FOREST_MAX_DIST)
-        amount = self.rand.randint(self.FOREST_MIN_NO, self.FOREST_MAX_NO)
-        y1 = self.rand.normal(pos[0], distance, size=(amount,)).astype('int')
-        x1 = self.rand.normal(pos[1], distance, size=(amount,)).astype('int')
+        distance = rand.randint(self.FOREST_MIN_DIST, self.FOREST_MAX_DIST)
+        amount = rand.randint(self.FOREST_MIN_NO, self.FOREST_MAX_NO)
+        y1 = rand.normal(pos[0], distance, size=(amount,)).astype('int')
+        x1 = rand.normal(pos[1], distance, size=(amount,)).astype('int')
         
-        for i in range(len(y1)):
-            for j in range(-self.FOREST_CHUNK_SIZE, self.FOREST_CHUNK_SIZE):
-                for k in range(-self.FOREST_CHUNK_SIZE, self.FOREST_CHUNK_SIZE):
-                    y = y1[i] + j
-                    x = x1[i] + k
-                    if self.get_cell_status((y,x)) == Status.EMPTY:
-                        self.set_cell_biome((y, x), CellType.forest.value)
+        kernel = self.block_kernel(self.FOREST_CHUNK_SIZE)
+        self.stamp(np.stack([y1, x1], axis=1), kernel, CellType.forest.value, where_status=Status.EMPTY)
     
     
     def place_fish(self, pos, biome):
@@ -275,13 +361,57 @@ class Map:
             pos (tuple): Middle coordinate of fish chunk
             biome (Biome): Biome to full. Use fish or whale.
         """
-        for j in range(-self.FISH_CHUNK_SIZE, self.FISH_CHUNK_SIZE):
-            for k in range(-self.FISH_CHUNK_SIZE, self.FISH_CHUNK_SIZE):
-                cur_pos = pos[0] + j, pos[1] + k
-                if self.get_cell_biome(cur_pos) == CellType.water.value:
-                    self.set_cell_biome(cur_pos, biome)
+        kernel = self.block_kernel(self.FISH_CHUNK_SIZE)
+        self.stamp([pos], kernel, biome, where_biome=CellType.water.value)
     
       
+    def block_kernel(self, chunk_size):
+        """Get a square footprint kernel covering offsets -chunk_size up to chunk_size-1
+
+        Args:
+            chunk_size (int): Half the width of the block
+
+        Returns:
+            np.ndarray: Boolean kernel of shape (2*chunk_size, 2*chunk_size)
+        """
+        return np.ones((2*chunk_size, 2*chunk_size), dtype=bool)
+    
+    
+    def stamp(self, centres, kernel, biome, where_status=None, where_biome=None):
+        """Stamp a footprint kernel around every centre and set the biome of the covered cells
+
+        Args:
+            centres (np.ndarray): Array of shape (N, 2) with kernel centre coordinates
+            kernel (np.ndarray): Boolean footprint, centred at index (height//2, width//2)
+            biome (Biome): Biome to set
+            where_status (Status, optional): Only change cells with this status. Defaults to None.
+            where_biome (Biome, optional): Only change cells with this biome. Defaults to None.
+
+        Returns:
+            np.ndarray: Array of shape (N, 2) with the stamped cells in row-major order
+        """
+        offsets = np.argwhere(kernel) - np.array(kernel.shape) // 2
+        coords = (np.asarray(centres, dtype=np.int64).reshape(-1, 1, 2) + offsets).reshape(-1, 2)
+        coords = coords[((coords >= 0) & (coords < self.size)).all(axis=1)]
+        if len(coords) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        
+        # Rasterize the coverage within the bounding box of all stamps
+        origin = coords.min(axis=0)
+        end = coords.max(axis=0) + 1
+        coverage = np.zeros(end - origin, dtype=bool)
+        coverage[coords[:, 0] - origin[0], coords[:, 1] - origin[1]] = True
+        
+        window = np.s_[origin[0]:end[0], origin[1]:end[1]]
+        if where_status is not None:
+            coverage &= self.status_layer[window] == where_status.value
+        if where_biome is not None:
+            coverage &= self.biome_layer[window] == where_biome.id
+        self.set_biome_where(coverage, biome, origin)
+        
+        return np.argwhere(coverage & (self.biome_layer[window] == biome.id)) + origin
+    
+    
     def close_to_placement(self, pos, min_dist):
         """Check if pos is within min_dist of a placement
 
@@ -292,30 +422,23 @@ class Map:
         Returns:
             bool: True if a placement is in reach. False if not.
         """
-        for placement in self.placements:
-            if dist(pos, placement) < min_dist:
-                return True
-        return False
+        return bool(self.placement_index.any_within(pos, min_dist)[0])
     
     
-    def place_hunt(self, pos):
+    def place_hunt(self, pos, rand):
         """Place hunt on map
 
         Args:
             pos (tuple): Hunt middle coordinate
+            rand (np.random.RandomState): Random object of the placing stage to draw from
         """
-        distance = self.rand.randint(5, 10)
-        amount = self.rand.randint(5, 10)
-        y1 = self.rand.normal(pos[0], distance, size=(amount,)).astype('int')
-        x1 = self.rand.normal(pos[1], distance, size=(amount,)).astype('int')
+        distance = rand.randint(5, 10)
+        amount = rand.randint(5, 10)
+        y1 = rand.normal(pos[0], distance, size=(amount,)).astype('int')
+        x1 = rand.normal(pos[1], distance, size=(amount,)).astype('int')
         
-        for i in range(len(y1)):
-            for j in range(-self.HUNT_CHUNK_SIZE, self.HUNT_CHUNK_SIZE):
-                for k in range(-self.HUNT_CHUNK_SIZE, self.HUNT_CHUNK_SIZE):
-                    y = y1[i] + j
-                    x = x1[i] + k
-                    if self.get_cell_status((y,x)) == Status.EMPTY:
-                        self.set_cell_biome((y,x), CellType.hunts.value)
+        kernel = self.block_kernel(self.HUNT_CHUNK_SIZE)
+        self.stamp(np.stack([y1, x1], axis=1), kernel, CellType.hunts.value, where_status=Status.EMPTY)
          
     
     
@@ -327,6 +450,7 @@ class Map:
             status (Status): Type of placement
         """
         self.placements.append(pos)
+        self.placement_index.add(pos)
         self.set_cell_status(pos, status)
     
     
@@ -351,25 +475,44 @@ class Map:
         Returns:
             bool: True if status is not OOB. False if it is.
         """
-        return self.cells[pos].status != Status.OOB
-    
+        return self.status_layer[pos] != Status.OOB.value
     
-    def set_cell_color(self, pos, color):
-        if self.legal_cell(pos): 
-            self.cells[pos].set_color(color)
         
     def set_cell_biome(self, pos, biome):
-        if self.legal_cell(pos):  
-            self.cells[pos].set_biome(biome)
+        if self.legal_cell(pos) and self.biome_layer[pos] != CellType.OOB.value.id:
+            if biome == CellType.water.value:
+                self.status_layer[pos] = Status.WATER.value
+            elif biome == CellType.traderoute.value:
+                self.status_layer[pos] = Status.TR.value
+            self.biome_layer[pos] = biome.id
+        
+    def set_biome_where(self, mask, biome, origin=(0, 0)):
+        """Set the biome of all cells in a mask, with the same status changes as set_cell_biome
+
+        Args:
+            mask (np.ndarray): Boolean array covering the map, or a window of it starting at origin
+            biome (Biome): Biome to set
+            origin (tuple, optional): Map coordinate of the first mask cell. Defaults to (0, 0).
+        """
+        window = np.s_[origin[0]:origin[0] + mask.shape[0], origin[1]:origin[1] + mask.shape[1]]
+        biome_layer = self.biome_layer[window]
+        status_layer = self.status_layer[window]
+        
+        mask = mask & (biome_layer != CellType.OOB.value.id)
+        if biome == CellType.water.value:
+            status_layer[mask] = Status.WATER.value
+        elif biome == CellType.traderoute.value:
+            status_layer[mask] = Status.TR.value
+        biome_layer[mask] = biome.id
         
     def set_cell_status(self, pos, status):
         if self.legal_cell(pos): 
-            self.cells[pos].set_status(status)
+            self.status_layer[pos] = status.value
             
     def get_cell_status(self, pos):
         if self.legal_cell(pos): 
-            return self.cells[pos].get_status()
+            return Status(self.status_layer[pos])
             
     def get_cell_biome(self, pos):
         if self.legal_cell(pos): 
-            return self.cells[pos].get_biome()
+            return get_biome(self.biome_layer[pos])
\ No newline at end of file
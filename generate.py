@@ -2,10 +2,30 @@
 generate.py: Main file used to generate the maps.
 """
 import argparse
+import contextlib
+import io
+import json
+import multiprocessing
 import os
+import shutil
+import signal
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from time import time
 
+import numpy as np
+from PIL import Image
+
+from analysis import MapAnalyzer
+from icon_loader import IconLoader
+from cell_map import Map
+from map_cache import MapCache
 from map_generator import MapGenerator
+from map_server import MapServer
+from noise_cache import NoiseCache
+from pipeline import MetricsHook, PrintHook
+from sweep import ParameterSweep, parse_overrides
 
 try:
     import gooey
@@ -30,6 +50,52 @@ def get_argparse_args():
                         help="Specify number of maps to be generated")
     parser.add_argument("--compass", action="store_true", 
                         help="Place compass icon around generated maps")
+    parser.add_argument("--palette", action="store_true", 
+                        help="Save maps as palettized images")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Specify number of worker processes")
+    parser.add_argument("--sample-workers", type=int, default=0,
+                        help="Specify number of processes computing the Poisson Disc samples of a map while its terrain is generated. Only used with a single worker")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Append per map stage metrics as JSON lines to this file")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Generate in tiles and write the image in bands to bound memory use for large maps. Ignores --compass and --palette")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="Specify cache directory to reuse previously generated maps")
+    parser.add_argument("--noise-cache", type=str, default=None,
+                        help="Specify directory to store and reuse noise fields in")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Specify maximum cache size in MB")
+    parser.add_argument("--cache-layers", action="store_true",
+                        help="Also store the raw map layers in the cache")
+    
+    subparsers = parser.add_subparsers(dest="command")
+    search_parser = subparsers.add_parser("search", 
+                        help="Generate --no seeds from --seed on without images and only save the balanced maps")
+    search_parser.add_argument("--min-tc-dist", type=float, default=None,
+                        help="Minimum distance between town centers, as a fraction of the map size")
+    search_parser.add_argument("--min-gold", type=int, default=None,
+                        help="Minimum number of gold mines within reach of every town center")
+    search_parser.add_argument("--max-water", type=float, default=None,
+                        help="Maximum water fraction around every town center")
+    
+    sweep_parser = subparsers.add_parser("sweep",
+                        help="Generate --no seeds from --seed on for every combination of MapGenerator constant overrides")
+    sweep_parser.add_argument("--param", type=str, action="append", required=True,
+                        help="Constant values to try, e.g. --param OCEAN_WATER_BOUND=0.05,0.1. Can be given multiple times")
+    sweep_parser.add_argument("--thumb-size", type=int, default=ParameterSweep.THUMB_SIZE,
+                        help="Size of the maps on the contact sheet")
+    
+    serve_parser = subparsers.add_parser("serve", 
+                        help="Serve maps over HTTP from --workers warm worker processes, the map options are request defaults")
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="Specify host to listen on")
+    serve_parser.add_argument("--port", type=int, default=8000,
+                        help="Specify port to listen on")
+    serve_parser.add_argument("--max-pending", type=int, default=64,
+                        help="Maximum number of queued and running maps, further requests are rejected")
+    serve_parser.add_argument("--lru-size", type=int, default=256,
+                        help="Number of recent maps kept in memory")
     return parser.parse_args()
 
 if not isinstance(gooey, ImportError):
@@ -66,6 +132,24 @@ if not isinstance(gooey, ImportError):
                             help="Specify number of maps to be generated")
         parser.add_argument("--compass", action="store_true", 
                             help="Place compass icon around generated maps")
+        parser.add_argument("--palette", action="store_true", 
+                            help="Save maps as palettized images")
+        parser.add_argument("--workers", type=int, default=1, widget='IntegerField', gooey_options={'min': 1, 'max': 64},
+                            help="Specify number of worker processes")
+        parser.add_argument("--sample-workers", type=int, default=0, widget='IntegerField', gooey_options={'min': 0, 'max': 64},
+                            help="Specify number of processes computing the Poisson Disc samples of a map while its terrain is generated. Only used with a single worker")
+        parser.add_argument("--metrics", type=str, default=None, widget='FileSaver',
+                            help="Append per map stage metrics as JSON lines to this file")
+        parser.add_argument("--tiled", action="store_true",
+                            help="Generate in tiles and write the image in bands to bound memory use for large maps. Ignores --compass and --palette")
+        parser.add_argument("--cache", type=str, default=None, widget='DirChooser',
+                            help="Specify cache directory to reuse previously generated maps")
+        parser.add_argument("--noise-cache", type=str, default=None, widget='DirChooser',
+                            help="Specify directory to store and reuse noise fields in")
+        parser.add_argument("--cache-size", type=int, default=1024, widget='IntegerField', gooey_options={'min': 1, 'max': 1024**2},
+                            help="Specify maximum cache size in MB")
+        parser.add_argument("--cache-layers", action="store_true",
+                            help="Also store the raw map layers in the cache")
         return parser.parse_args()
 
     get_args = get_gooey_args
@@ -73,25 +157,405 @@ else:
     get_args = get_argparse_args
 
 
-# Parse arguments
+# Icons loaded once per worker process
+icons = None
+# Map cache opened once per worker process
+cache = None
+# Noise cache shared by all maps of a worker process
+noise_cache = None
+# Executor computing Poisson Disc samples in single worker runs
+sample_executor = None
+
+
+def init_worker(icon_path="icons", trace_memory=False, noise_cache_dir=None):
+    """Load the icons of a worker process
+
+    Args:
+        icon_path (str, optional): Path to icons folder. Defaults to "icons".
+        trace_memory (bool, optional): Whether to trace memory allocations for the stage metrics. Defaults to False.
+        noise_cache_dir (str, optional): Directory to store noise fields in, no noise cache is used if None. Defaults to None.
+    """
+    global icons, noise_cache
+    icons = IconLoader(icon_path)
+    if noise_cache_dir is not None:
+        noise_cache = NoiseCache(path=noise_cache_dir)
+    if trace_memory:
+        tracemalloc.start()
+
+
+def get_cache(args):
+    """Get the map cache of this process
+
+    Args:
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        MapCache: Map cache, None if caching is disabled
+    """
+    global cache
+    if cache is None and getattr(args, "cache", None):
+        cache = MapCache(args.cache, args.cache_size * 1024**2)
+    return cache
+
+
+def load_cached(map_cache, key, map_path):
+    """Copy a cached map to the output path
+
+    Args:
+        map_cache (MapCache): Map cache
+        key (str): Cache key
+        map_path (str): Output path
+
+    Returns:
+        bool: True if the map was copied, False on a miss
+    """
+    cached_path = map_cache.get(key)
+    if cached_path is None:
+        return False
+    
+    try:
+        shutil.copyfile(cached_path, map_path)
+    except FileNotFoundError:
+        # Evicted by another process after the lookup
+        return False
+    print("Loading map from cache...")
+    return True
+
+
+def generate_map(seed, args):
+    """Generate and save a single map, or copy it from the cache
+
+    Args:
+        seed (int): Map seed
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        str: Path of the saved map
+        dict: Stage and resource metrics of the map
+    """
+    if getattr(args, "tiled", False):
+        return generate_tiled_map(seed, args)
+    
+    def generate(map_generator, map_path):
+        generated = map_generator.generate_headless(args.type, args.biome, sample_executor)
+        map_generator.generate_image(generated, args.compass, args.palette).save(map_path)
+        return generated
+    
+    return save_map(seed, args, generate, args.compass, args.palette)
+
+
+def generate_tiled_map(seed, args):
+    """Generate a large map in tiles and write it to file band by band, or copy it from the cache.
+    The map layers are memory mapped in a temporary directory next to the output.
+
+    Args:
+        seed (int): Map seed
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        str: Path of the saved map
+        dict: Stage and resource metrics of the map
+    """
+    def generate(map_generator, map_path):
+        return map_generator.generate_file(map_path, args.type, args.biome, sample_executor)
+    
+    return save_map(seed, args, generate, tile_size=Map.TILE_SIZE)
+
+
+def save_map(seed, args, generate, compass=False, palettized=False, tile_size=None):
+    """Generate a map with the given generate call and store it in the cache, or copy it from the cache
+
+    Args:
+        seed (int): Map seed
+        args (argparse.Namespace): Parsed arguments
+        generate (callable): Function called with the MapGenerator and the output path, saving the map and
+            returning its GeneratedMap
+        compass (bool, optional): Whether the compass graphic is added, part of the cache key. Defaults to False.
+        palettized (bool, optional): Whether the image is palettized, part of the cache key. Defaults to False.
+        tile_size (int, optional): Tile size, the layers are memory mapped in a temporary directory next to
+            the output if set. Defaults to None.
+
+    Returns:
+        str: Path of the saved map
+        dict: Stage and resource metrics of the map
+    """
+    map_path = os.path.join(args.out, 'map_{}.png'.format(seed))
+    map_cache = get_cache(args)
+    if map_cache is not None:
+        key = map_cache.key(seed, args.size, args.type, args.biome, compass, palettized)
+        if load_cached(map_cache, key, map_path):
+            return map_path, {"seed": seed, "size": args.size, "path": map_path, "cached": True, "stages": []}
+    
+    metrics_hook = MetricsHook()
+    layer_dirs = tempfile.TemporaryDirectory(dir=args.out) if tile_size is not None else contextlib.nullcontext()
+    with layer_dirs as layer_dir:
+        map_generator = MapGenerator(args.size, seed, icons=icons, hooks=[PrintHook(), metrics_hook],
+                                     tile_size=tile_size, layer_dir=layer_dir, noise_cache=noise_cache)
+        generated = generate(map_generator, map_path)
+        resources = MapAnalyzer().resource_split(generated)
+        
+        if map_cache is not None:
+            layers = None
+            if args.cache_layers:
+                layers = {"biome_layer": map_generator.map.biome_layer, "status_layer": map_generator.map.status_layer}
+            map_cache.put_file(key, map_path, layers)
+        
+        # Release the memory maps before the layer files are removed
+        del map_generator, generated
+    
+    metrics = {
+        "seed": seed,
+        "size": args.size,
+        "path": map_path,
+        "cached": False,
+        "stages": metrics_hook.pop_metrics(),
+        "resources": resources,
+    }
+    return map_path, metrics
+
+
+def get_seeds(seed, no):
+    """Derive the seeds of a batch of maps from a base seed
+
+    Args:
+        seed (int): Base seed, chosen randomly if None
+        no (int): Number of maps
+
+    Returns:
+        list: Map seeds
+    """
+    if seed is None:
+        seed = np.random.randint(0, 10000000)
+    return [seed + i for i in range(no)]
+
+
+def search_map(seed, args):
+    """Generate a map without imaging, evaluate its balance and only save it when it passes
+
+    Args:
+        seed (int): Map seed
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        str: Path of the saved map, None if the map was rejected
+        dict: Balance metrics of the map
+    """
+    map_generator = MapGenerator(args.size, seed, icons=icons, hooks=[], noise_cache=noise_cache)
+    generated = map_generator.generate_headless(args.type, args.biome, sample_executor)
+    
+    analyzer = MapAnalyzer()
+    balance = analyzer.balance_metrics(generated)
+    passed = analyzer.passes(balance, args.min_tc_dist, args.min_gold, args.max_water)
+    
+    map_path = None
+    if passed:
+        random_map = map_generator.render(generated, args.compass, args.palette)
+        map_path = os.path.join(args.out, 'map_{}.png'.format(seed))
+        random_map.save(map_path)
+        
+    metrics = {
+        "seed": seed,
+        "size": args.size,
+        "path": map_path,
+        "passed": passed,
+        "balance": balance,
+        "resources": analyzer.resource_split(generated),
+    }
+    return map_path, metrics
+
+
+def sweep_seed(seed, args):
+    """Generate the maps of all sweep combinations for one seed
+
+    Args:
+        seed (int): Map seed
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        int: Map seed
+        list: (thumbnail, metrics) tuple per combination
+    """
+    print("Sweeping seed {}...".format(seed))
+    sweep = ParameterSweep(parse_overrides(args.param))
+    return seed, sweep.run_seed(seed, args.size, args.type, args.biome, icons, noise_cache, args.thumb_size)
+
+
+def run_sweep(args):
+    """Run a parameter sweep and save its contact sheet and metrics
+
+    Args:
+        args (argparse.Namespace): Parsed arguments
+    """
+    try:
+        sweep = ParameterSweep(parse_overrides(args.param))
+    except ValueError as e:
+        print(e)
+        return
+    
+    seeds = get_seeds(args.seed, args.no)
+    combinations = sweep.combinations()
+    
+    start_time = time()
+    results = dict(run_jobs(sweep_seed, seeds, args))
+    total_time = time() - start_time
+    
+    metrics_path = args.metrics or os.path.join(args.out, "sweep.jsonl")
+    noise_fields = 0
+    with open(metrics_path, "a") as metrics_file:
+        for seed in seeds:
+            for _, metrics in results[seed]:
+                metrics_file.write(json.dumps(metrics) + "\n")
+                noise_fields += sum(stage["counts"].get("noise_cache_misses", 0) for stage in metrics["stages"])
+    
+    thumbnails = [[results[seed][index][0] for seed in seeds] for index in range(len(combinations))]
+    sheet_path = os.path.join(args.out, "sweep.png")
+    sweep.contact_sheet(thumbnails, seeds).save(sheet_path)
+    
+    print("Saving contact sheet to {} and metrics to {}".format(sheet_path, metrics_path))
+    print("Generated {} maps for {} combinations, computing {} noise fields, in {}s".format(
+        len(seeds) * len(combinations), len(combinations), noise_fields, total_time))
+
+
+def init_server_worker(noise_cache_dir=None):
+    """Load the icons of a server worker process. Interrupts are left to the server process, which shuts the workers down.
+    Server workers always keep recent noise fields in memory, as maps are often requested again with other options.
+
+    Args:
+        noise_cache_dir (str, optional): Directory to also store noise fields in. Defaults to None.
+    """
+    global noise_cache
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker()
+    noise_cache = NoiseCache(path=noise_cache_dir)
+
+
+def serve_map(params):
+    """Generate a map for a server request
+
+    Args:
+        params (dict): Map parameters, see MapServer.parse_params
+
+    Returns:
+        bytes or dict: PNG data, or the placements if JSON output is requested
+    """
+    map_generator = MapGenerator(params["size"], params["seed"], icons=icons, hooks=[], noise_cache=noise_cache)
+    generated = map_generator.generate_headless(params["type"], params["biome"])
+    if params["format"] == "json":
+        return generated.placements()
+    
+    random_map = map_generator.render(generated, params["compass"], params["palette"])
+    data = io.BytesIO()
+    random_map.save(data, format="PNG")
+    return data.getvalue()
+
+
+def serve(args):
+    """Run the map server until interrupted
+
+    Args:
+        args (argparse.Namespace): Parsed arguments
+    """
+    defaults = {
+        "seed": None,
+        "size": args.size,
+        "type": args.type,
+        "biome": args.biome,
+        "compass": args.compass,
+        "palette": args.palette,
+        "format": "png",
+    }
+    workers = max(args.workers, 1)
+    with ProcessPoolExecutor(workers, initializer=init_server_worker, initargs=(args.noise_cache,)) as executor:
+        # Start all workers and load their icons before accepting requests
+        for future in [executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        
+        server = MapServer((args.host, args.port), executor, serve_map, defaults, workers, args.max_pending, args.lru_size)
+        print("Serving maps on http://{}:{}/map with {} workers".format(*server.server_address[:2], workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def run_jobs(func, seeds, args, trace_memory=False):
+    """Run a job for every seed, in worker processes if requested
+
+    Args:
+        func (callable): Job function, called with a seed and the arguments
+        seeds (list): Map seeds
+        args (argparse.Namespace): Parsed arguments
+        trace_memory (bool, optional): Whether to trace memory allocations. Defaults to False.
+
+    Yields:
+        Any: Job results in completion order
+    """
+    global sample_executor
+    if args.workers <= 1:
+        init_worker(trace_memory=trace_memory, noise_cache_dir=args.noise_cache)
+        if getattr(args, "sample_workers", 0) > 0:
+            sample_executor = ProcessPoolExecutor(args.sample_workers)
+        try:
+            for seed in seeds:
+                yield func(seed, args)
+        finally:
+            if sample_executor is not None:
+                sample_executor.shutdown()
+                sample_executor = None
+    else:
+        with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=("icons", trace_memory, args.noise_cache)) as executor:
+            futures = [executor.submit(func, seed, args) for seed in seeds]
+            for future in as_completed(futures):
+                yield future.result()
+
+
 def main():
     args = get_args()
+    
+    if getattr(args, "command", None) == "serve":
+        serve(args)
+        return
 
     os.makedirs(args.out, exist_ok=True)
+    if getattr(args, "command", None) == "sweep":
+        run_sweep(args)
+        return
+    
+    seeds = get_seeds(args.seed, args.no)
+    search = getattr(args, "command", None) == "search"
+    
+    metrics_file = open(args.metrics, "a") if args.metrics else None
+    trace_memory = metrics_file is not None and not search
         
     start_time = time()
-    for _ in range(args.no):
-        map_generator = MapGenerator(args.size, args.seed)
-        random_map = map_generator.generate(args.type, args.biome, args.compass)
-        map_path = os.path.join(args.out, 'map_{}.png'.format(map_generator.seed))
-        print("Saving map to {}".format(map_path))
-        random_map.save(map_path)
+    map_path = None
+    no_saved = 0
+    for result_path, metrics in run_jobs(search_map if search else generate_map, seeds, args, trace_memory):
+        if metrics_file is not None:
+            metrics_file.write(json.dumps(metrics) + "\n")
+        if search:
+            print("Seed {}: {} {}".format(metrics["seed"], "accepted" if metrics["passed"] else "rejected", metrics["balance"]))
+        if result_path is not None:
+            map_path = result_path
+            no_saved += 1
+            print("Saving map to {}".format(map_path))
 
     total_time = time() - start_time
+    
+    if metrics_file is not None:
+        metrics_file.close()
+
+    if search:
+        print("Accepted {} of {} seeds".format(no_saved, len(seeds)))
+    print("Generating took {}s ({:.2f} maps/s)".format(total_time, len(seeds) / total_time))
 
-    print("Generating took {}s".format(total_time))
+    # Tiled maps are too large to show
+    if args.no <= 1 and map_path is not None and not getattr(args, "tiled", False):
+        Image.open(map_path).show()
 
-    if args.no <= 1:
-        random_map.show()
 
-main()
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class GeneratedMap:
+    """Structured result of a map generation, without any image data
+    """
+
+    def __init__(self, seed, size, biome, map_type, biome_layer, status_layer,
+                 tc_pos, gold_pos, trade_pos, native_pos, treasure_pos, hunt_pos=None):
+        """Initializer
+
+        Args:
+            seed (int): Map seed
+            size (int): Map size
+            biome (Biome): Main terrain biome
+            map_type (MapType): Map type
+            biome_layer (np.ndarray): uint8 array of biome ids, see biome.BIOME_LIST
+            status_layer (np.ndarray): int8 array of cell Status values
+            tc_pos (list): Town center locations
+            gold_pos (list): Gold mine locations, including the starting mines of the town centers
+            trade_pos (list): Trade post locations
+            native_pos (list): Native settlement locations
+            treasure_pos (list): Treasure locations
+            hunt_pos (list, optional): Hunt middle locations, including the starting hunts of the town centers. Defaults to None.
+        """
+        self.seed = seed
+        self.size = size
+        self.biome = biome
+        self.map_type = map_type
+        self.biome_layer = biome_layer
+        self.status_layer = status_layer
+        self.tc_pos = self.to_coords(tc_pos)
+        self.gold_pos = self.to_coords(gold_pos)
+        self.trade_pos = self.to_coords(trade_pos)
+        self.native_pos = self.to_coords(native_pos)
+        self.treasure_pos = self.to_coords(treasure_pos)
+        self.hunt_pos = self.to_coords(hunt_pos if hunt_pos is not None else [])
+
+    def to_coords(self, positions):
+        """Convert a list of positions to a coordinate array
+
+        Args:
+            positions (list): List of (y, x) positions
+
+        Returns:
+            np.ndarray: Array of shape (N, 2)
+        """
+        return np.array(positions, dtype=np.int64).reshape(-1, 2)
+
+    def placements(self):
+        """Get the map description and placement locations as plain Python types, e.g. for JSON output
+
+        Returns:
+            dict: Map seed, size, biome, type and lists of (y, x) locations per placement type
+        """
+        return {
+            "seed": self.seed,
+            "size": self.size,
+            "biome": self.biome.name,
+            "map_type": self.map_type.name,
+            "tc": self.tc_pos.tolist(),
+            "gold": self.gold_pos.tolist(),
+            "trade_posts": self.trade_pos.tolist(),
+            "natives": self.native_pos.tolist(),
+            "treasures": self.treasure_pos.tolist(),
+            "hunts": self.hunt_pos.tolist(),
+        }
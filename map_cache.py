@@ -0,0 +1,187 @@
+import hashlib
+import importlib.util
+import json
+import marshal
+import os
+import shutil
+
+import numpy as np
+
+
+class MapCache:
+    """Content addressed on-disk cache of generated maps.
+    Entries are keyed by the generation parameters and a hash of the generator code, so changes to the
+    generator never serve stale maps. When the cache grows over its maximum size, the least recently used
+    entries are removed.
+    """
+
+    """
+    Constants
+    """
+    GENERATOR_MODULES = ("biome", "cell", "cell_map", "generated_map", "icon_loader", "map_generator",
+                         "noise_generator", "perlin", "placement_index", "png_writer", "utils")
+
+    def __init__(self, path, max_size=1024**3):
+        """Initializer
+
+        Args:
+            path (str): Cache directory
+            max_size (int, optional): Maximum total size of the cache in bytes. Defaults to 1 GiB.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.version = self.generator_version()
+        os.makedirs(path, exist_ok=True)
+
+    def generator_version(self):
+        """Hash the code of all modules taking part in map generation
+
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.sha256()
+        for name in self.GENERATOR_MODULES:
+            spec = importlib.util.find_spec(name)
+            try:
+                with open(spec.origin, "rb") as f:
+                    digest.update(f.read())
+            except (OSError, TypeError):
+                # No source available, e.g. in a PyInstaller executable
+                digest.update(marshal.dumps(spec.loader.get_code(name)))
+        return digest.hexdigest()
+
+    def key(self, seed, size, type_str, biome_str, compass, palettized):
+        """Get the cache key of a map
+
+        Args:
+            seed (int): Map seed
+            size (int): Map size
+            type_str (str): Map type, may be "random"
+            biome_str (str): Map biome, may be "random"
+            compass (bool): Whether the compass graphic is added
+            palettized (bool): Whether the image is palettized
+
+        Returns:
+            str: Hex digest
+        """
+        params = [self.version, seed, size, type_str, biome_str, compass, palettized]
+        return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+    def image_path(self, key):
+        """Get the image path of a cache entry
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str: Path of the PNG file
+        """
+        return os.path.join(self.path, key + ".png")
+
+    def layers_path(self, key):
+        """Get the layers path of a cache entry
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str: Path of the npz file
+        """
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, key):
+        """Get the image path of a cached map and mark the entry as recently used
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str: Path of the cached image, None on a miss
+        """
+        image_path = self.image_path(key)
+        try:
+            os.utime(image_path)
+        except FileNotFoundError:
+            return None
+        return image_path
+
+    def get_layers(self, key):
+        """Get the cached map layers
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            dict: biome_layer and status_layer arrays, None if the layers were not cached
+        """
+        try:
+            with np.load(self.layers_path(key)) as layers:
+                return dict(layers)
+        except FileNotFoundError:
+            return None
+
+    def put_file(self, key, path, layers=None):
+        """Store a map PNG file in the cache and evict old entries if the cache is full
+
+        Args:
+            key (str): Cache key
+            path (str): Path of the map PNG file
+            layers (dict, optional): Arrays to store with the image, e.g. the biome and status layers. Defaults to None.
+
+        Returns:
+            str: Path of the cached image
+        """
+        return self.store(key, lambda tmp_path: shutil.copyfile(path, tmp_path), layers)
+
+    def store(self, key, write_image, layers=None):
+        """Store a cache entry and evict old entries if the cache is full
+
+        Args:
+            key (str): Cache key
+            write_image (callable): Function writing the PNG image to the path it is called with
+            layers (dict, optional): Arrays to store with the image. Defaults to None.
+
+        Returns:
+            str: Path of the cached image
+        """
+        # Write to temporary files first so other processes never read partial entries
+        tmp_suffix = ".{}.tmp".format(os.getpid())
+        if layers is not None:
+            layers_path = self.layers_path(key)
+            with open(layers_path + tmp_suffix, "wb") as f:
+                np.savez(f, **layers)
+            os.replace(layers_path + tmp_suffix, layers_path)
+
+        image_path = self.image_path(key)
+        write_image(image_path + tmp_suffix)
+        os.replace(image_path + tmp_suffix, image_path)
+
+        self.evict()
+        return image_path
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits its maximum size
+        """
+        entries = {}
+        for entry in os.scandir(self.path):
+            key, ext = os.path.splitext(entry.name)
+            if ext not in (".png", ".npz"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            last_used, size = entries.get(key, (0, 0))
+            last_used = stat.st_mtime if ext == ".png" else last_used
+            entries[key] = (last_used, size + stat.st_size)
+
+        total_size = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda entry: entry[1][0]):
+            if total_size <= self.max_size:
+                break
+            for path in (self.image_path(key), self.layers_path(key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
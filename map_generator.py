@@ -1,12 +1,17 @@
+from functools import partial
+
 import numpy as np
 from PIL import Image
 
 from biome import *
 from cell import *
 from cell_map import *
+from generated_map import GeneratedMap
 from icon_loader import IconLoader
-from noise_generator import NoiseGenerator
-from utils import dist, midpoint
+from noise_generator import NoiseGenerator, poisson_disc_samples
+from pipeline import Pipeline, PrintHook, Stage
+from png_writer import PNGWriter
+from utils import distances, midpoint
 
 
 class MapGenerator:
@@ -23,6 +28,10 @@ class MapGenerator:
     LAKE_NOISE_FREQ = 7.0
     LAKE_WATER_BOUND = 0.2
     LAKE_TRADE_DIST = 10
+    NOISE_OCTAVES = 1
+    NOISE_LACUNARITY = 2.0
+    NOISE_PERSISTENCE = 0.5
+    NOISE_UPSAMPLE = True
     FISH_WHALE_CHANCE = 0.8
     FISH_MIN_DIST_DIV = 20
     WHALE_CHANCE = 0.3
@@ -45,14 +54,36 @@ class MapGenerator:
     TC_MIN_DIST_DIV = 3
     TC_MIN_DIST_DIST_PLACE_DIV = 20 
     
+    """
+    Generation stages, each draws from its own random stream
+    """
+    STAGES = ("setup", "terrain", "trade_route", "fish", "forest", "hunts", "tc", "natives", "gold", "treasures")
+    
+    """
+    Stages placing objects on Poisson Disc samples, with the constant dividing the map size into the sample distance
+    """
+    SAMPLE_STAGES = {
+        "fish": "FISH_MIN_DIST_DIV",
+        "forest": "FOREST_MIN_DIST_DIV",
+        "hunts": "HUNT_MIN_DIST_DIV",
+        "natives": "NATIVE_MIN_DIST_DIV",
+        "gold": "GOLD_MIN_DIST_DIV",
+        "treasures": "TREASURE_MIN_DIST_DIV",
+    }
+    
     
-    def __init__(self, size, seed, icon_path="icons"):
+    def __init__(self, size, seed, icon_path="icons", icons=None, hooks=None, tile_size=None, layer_dir=None, noise_cache=None):
         """Initializer
 
         Args:
             size (int): Map size
             seed (int): Map seed
             icon_path (str, optional): Path to icons folder. Defaults to "icons".
+            icons (IconLoader, optional): Already loaded icons, loaded from icon_path when first needed if None. Defaults to None.
+            hooks (list, optional): StageHook objects called around every stage. Defaults to printing progress.
+            tile_size (int, optional): Tile size to bound the memory use of large maps, see Map. Defaults to None.
+            layer_dir (str, optional): Directory to memory map the map layers in, see Map. Defaults to None.
+            noise_cache (NoiseCache, optional): Cache to reuse noise fields from. Defaults to None.
         """
         if seed == None:
             self.seed = np.random.randint(0, 10000000)
@@ -60,95 +91,292 @@ class MapGenerator:
             self.seed = seed
             
         self.size = size
-        self.rand = np.random.RandomState(self.seed)
-        self.map = Map(size, self.rand)
-        self.noise_gen = NoiseGenerator(size, self.rand)
-        self.icons = IconLoader(icon_path)
+        self.rand = self.stage_rand("setup")
+        self.map = Map(size, tile_size, layer_dir)
+        self.noise_gen = NoiseGenerator(size, self.stage_rand("terrain"), noise_cache)
+        self.icon_path = icon_path
+        self.icons = icons
+        self.sample_futures = {}
+        self.pipeline = Pipeline(hooks if hooks is not None else [PrintHook()])
         
     
-    def generate(self, type_str=None, biome_str=None, paste_compass=False):
+    def generate(self, type_str=None, biome_str=None, paste_compass=False, palettized=False, executor=None):
         """Main generate function
 
         Args:
             type_str (str, optional): Map type to generate, randomly selected if None. Defaults to None.
             biome_str (str, optional): Biome type to generate, randomly selected if None. Defaults to None.
             paste_compass (bool, optional): Whether to add compass graphic to maps. Defaults to False.
+            palettized (bool, optional): Whether to return a palettized (P mode) image. Defaults to False.
+            executor (concurrent.futures.Executor, optional): Executor, e.g. a ProcessPoolExecutor, to compute
+                all Poisson Disc sample sets on while the terrain is generated. Defaults to None.
 
         Returns:
             PIL.Image: Map image file
         """
+        generated = self.generate_headless(type_str, biome_str, executor)
+        return self.generate_image(generated, paste_compass, palettized)
+    
+    
+    def generate_image(self, generated, paste_compass=False, palettized=False):
+        """Generate the image of generated map data as the render stage of the pipeline
+
+        Args:
+            generated (GeneratedMap): Map data from generate_headless
+            paste_compass (bool, optional): Whether to add compass graphic to maps. Defaults to False.
+            palettized (bool, optional): Whether to return a palettized (P mode) image. Defaults to False.
+
+        Returns:
+            PIL.Image: Map image file
         """
-        Generating map
+        render = partial(self.render, generated, paste_compass, palettized)
+        return self.pipeline.run(Stage("render", "Image", render))
+    
+    
+    def generate_file(self, path, type_str=None, biome_str=None, executor=None):
+        """Generate a map and write it straight to a PNG file, one row band at a time.
+        Used for large maps, which do not fit in memory as a single image.
+
+        Args:
+            path (str): Output file path
+            type_str (str, optional): Map type to generate, randomly selected if None. Defaults to None.
+            biome_str (str, optional): Biome type to generate, randomly selected if None. Defaults to None.
+            executor (concurrent.futures.Executor, optional): Executor to compute the Poisson Disc sample sets on. Defaults to None.
+
+        Returns:
+            GeneratedMap: Map layers and placement locations
+        """
+        generated = self.generate_headless(type_str, biome_str, executor)
+        self.pipeline.run(Stage("render", "Image", partial(self.render_file, generated, path)))
+        return generated
+    
+    
+    def generate_headless(self, type_str=None, biome_str=None, executor=None):
+        """Generate the map data only, without any imaging work or icon loading
+
+        Args:
+            type_str (str, optional): Map type to generate, randomly selected if None. Defaults to None.
+            biome_str (str, optional): Biome type to generate, randomly selected if None. Defaults to None.
+            executor (concurrent.futures.Executor, optional): Executor, e.g. a ProcessPoolExecutor, to compute
+                all Poisson Disc sample sets on while the terrain is generated. Defaults to None.
+
+        Returns:
+            GeneratedMap: Map layers and placement locations
+        """
+        if executor is not None:
+            self.precompute_samples(executor)
+        
+        biome, map_type = self.pipeline.run(Stage("setup", "Map Layout", partial(self.generate_layout, type_str, biome_str)))
+        
+        results = {}
+        for stage in self.get_stages(map_type):
+            results[stage.name] = self.pipeline.run(stage)
+        
+        tc_pos, gold_pos, hunt_pos = results["tc"]
+        return GeneratedMap(
+            seed=self.seed,
+            size=self.size,
+            biome=biome,
+            map_type=map_type,
+            biome_layer=self.map.biome_layer,
+            status_layer=self.map.status_layer,
+            tc_pos=tc_pos,
+            gold_pos=gold_pos + results["gold"],
+            trade_pos=results.get("trade_route", []),
+            native_pos=results["natives"],
+            treasure_pos=results["treasures"],
+            hunt_pos=hunt_pos + results["hunts"],
+        )
+    
+    
+    def get_stages(self, map_type):
+        """Get the generation stages following the map layout
+
+        Args:
+            map_type (MapType): Selected map type
+
+        Returns:
+            list: List of Stage objects, in order
         """
-        biome = self.generate_biome(biome_str)
-        self.map.set_biome(biome)
-        print("Biome selected: {}".format(biome))
-        
-        map_type = self.generate_map_type(type_str)
-        print("Map type selected: {}".format(map_type))
-        
-        trade_pos = []
         if map_type == MapType.island:
-            print("Generating Ocean...")
-            self.generate_ocean()
-
-        elif map_type == MapType.land:
-            print("Generating Trade Route...")
-            trade_pos = self.generate_trade_route()
-            print("Generating Lakes...")
-            self.generate_lakes()
-            
-        print("Generating Fish...")
-        self.generate_fish()
+            stages = [Stage("ocean", "Ocean", self.generate_ocean)]
+        else:
+            stages = [
+                Stage("trade_route", "Trade Route", self.generate_trade_route),
+                Stage("lakes", "Lakes", self.generate_lakes),
+            ]
             
-        print("Generating Forests...")
-        self.generate_forest()
-        
-        print("Generating Hunts...")
-        self.generate_hunts()
-        
-        print("Generating Town Centers...")
-        tc_pos, gold_pos = self.generate_tc()
-        
-        print("Generating Native Settlements...")
-        native_pos = self.generate_natives()
-        
-        print("Generating Gold Mines...")
-        gold_pos2 = self.generate_gold()
-        
-        gold_pos.extend(gold_pos2)
-        
-        print("Generating Treasures...")
-        treasure_pos = self.generate_treasures()
-        
-        
-        """
-        Generating Image from map data
+        return stages + [
+            Stage("fish", "Fish", self.generate_fish),
+            Stage("forest", "Forests", self.generate_forest),
+            Stage("hunts", "Hunts", self.generate_hunts),
+            Stage("tc", "Town Centers", self.generate_tc),
+            Stage("natives", "Native Settlements", self.generate_natives),
+            Stage("gold", "Gold Mines", self.generate_gold),
+            Stage("treasures", "Treasures", self.generate_treasures),
+        ]
+    
+    
+    def render(self, generated, paste_compass=False, palettized=False):
+        """Render the map and its placements to an image
+
+        Args:
+            generated (GeneratedMap): Generated map data
+            paste_compass (bool, optional): Whether to add compass graphic to maps. Defaults to False.
+            palettized (bool, optional): Whether to return a palettized (P mode) image. Defaults to False.
+
+        Returns:
+            PIL.Image: Map image file
         """
+        icons = self.get_icons()
         values = self.map.get_values_array()
         im = Image.fromarray(values)
         
-        for pos in native_pos:
-            self.paste_icon(im, self.icons.np, pos)
+        for pos in generated.native_pos:
+            self.paste_icon(im, icons.np, pos)
             
-        for pos in trade_pos:
-            self.paste_icon(im, self.icons.tp, pos)
+        for pos in generated.trade_pos:
+            self.paste_icon(im, icons.tp, pos)
         
-        self.paste_icon(im, self.icons.tc_blue, tc_pos[0])
-        self.paste_icon(im, self.icons.tc_red, tc_pos[1])
+        self.paste_icon(im, icons.tc_blue, generated.tc_pos[0])
+        self.paste_icon(im, icons.tc_red, generated.tc_pos[1])
         
-        for pos in gold_pos:
-            self.paste_icon(im, self.icons.gold, pos)
+        for pos in generated.gold_pos:
+            self.paste_icon(im, icons.gold, pos)
             
-        for pos in treasure_pos:
-            self.paste_icon(im, self.icons.treasure, pos)
+        for pos in generated.treasure_pos:
+            self.paste_icon(im, icons.treasure, pos)
         
         if paste_compass:
             im = self.paste_compass(im)
+        
+        if palettized:
+            im = self.palettize(im)
        
         return im
         
     
+    def render_file(self, generated, path):
+        """Render the map and its placements to a PNG file, one row band of the map at a time
+
+        Args:
+            generated (GeneratedMap): Generated map data
+            path (str): Output file path
+        """
+        icons = self.get_icons()
+        # Same paste order as render
+        placements = [
+            (icons.np, generated.native_pos),
+            (icons.tp, generated.trade_pos),
+            (icons.tc_blue, generated.tc_pos[:1]),
+            (icons.tc_red, generated.tc_pos[1:2]),
+            (icons.gold, generated.gold_pos),
+            (icons.treasure, generated.treasure_pos),
+        ]
+        
+        with PNGWriter(path, self.size, self.size) as writer:
+            for window in self.map.bands():
+                band = Image.fromarray(self.map.get_values_array(window))
+                for icon, positions in placements:
+                    for pos in positions.tolist():
+                        self.paste_icon(band, icon, pos, (window[0].start, 0))
+                writer.write_rows(np.asarray(band))
+    
+    
+    def get_icons(self):
+        """Get the icons, loading them on first use
+
+        Returns:
+            IconLoader: Loaded icons
+        """
+        if self.icons is None:
+            self.icons = IconLoader(self.icon_path)
+        return self.icons
+    
+    
+    def stage_rand(self, stage):
+        """Get a fresh random object for a generation stage. Streams are spawned from the map
+        seed with SeedSequence, so every stage can be reproduced independently of the others.
+
+        Args:
+            stage (str): Stage name, one of STAGES
+
+        Returns:
+            np.random.RandomState: Random object of the stage
+        """
+        seed_seq = np.random.SeedSequence(self.seed, spawn_key=(self.STAGES.index(stage),))
+        return np.random.RandomState(np.random.PCG64(seed_seq))
+    
+    
+    def sample_args(self, stage):
+        """Get the arguments of stage_samples for a stage
+
+        Args:
+            stage (str): Stage name, one of SAMPLE_STAGES
+
+        Returns:
+            tuple: Map size, sample distance, map seed and stage index
+        """
+        r = self.size / getattr(self, self.SAMPLE_STAGES[stage])
+        return self.size, r, self.seed, self.STAGES.index(stage)
+    
+    
+    def poisson_samples(self, stage):
+        """Generate the Poisson Disc samples of a stage. Only depends on the map size and seed.
+
+        Args:
+            stage (str): Stage name, one of SAMPLE_STAGES
+
+        Returns:
+            np.ndarray: Array of shape (N, 2) with samples
+        """
+        return stage_samples(*self.sample_args(stage))
+    
+    
+    def precompute_samples(self, executor):
+        """Start computing the Poisson Disc samples of all stages. Only plain arguments are submitted,
+        so process pools do not need to pickle the generator.
+
+        Args:
+            executor (concurrent.futures.Executor): Executor to submit the computations to
+        """
+        self.sample_futures = {stage: executor.submit(stage_samples, *self.sample_args(stage)) for stage in self.SAMPLE_STAGES}
+    
+    
+    def get_samples(self, stage):
+        """Get the Poisson Disc samples of a stage, precomputed if available
+
+        Args:
+            stage (str): Stage name, one of SAMPLE_STAGES
+
+        Returns:
+            np.ndarray: Array of shape (N, 2) with samples
+        """
+        future = self.sample_futures.pop(stage, None)
+        if future is not None:
+            return future.result()
+        return self.poisson_samples(stage)
+    
+    
+    def generate_layout(self, type_str, biome_str):
+        """Select the biome and map type and fill the map with the biome
+
+        Args:
+            type_str (str): Map type to generate, randomly selected if None.
+            biome_str (str): Biome type to generate, randomly selected if None.
+
+        Returns:
+            Biome: Selected biome
+            MapType: Selected map type
+        """
+        biome = self.generate_biome(biome_str)
+        self.map.set_biome(biome)
+        map_type = self.generate_map_type(type_str)
+        
+        self.pipeline.record(biome=biome.name, map_type=map_type.name)
+        return biome, map_type
+    
+    
     def generate_biome(self, biome_str):
         """Select biome to generate from biome_str. Chosen randomly if None.
 
@@ -188,41 +416,71 @@ class MapGenerator:
     def generate_ocean(self):
         """Generate an ocean using an Adjusted Perlin noise function
         """
-        noise = self.noise_gen.ocean_noise(self.OCEAN_NOISE_FREQ, self.OCEAN_NOISE_DIST)
-        
-        for y in range(len(noise)):
-            for x in range(len(noise[y])):
-                if self.map.is_in_bounds((y,x)) and noise[y][x] < self.OCEAN_WATER_BOUND:
-                    self.map.set_cell_biome((y,x), CellType.water.value)
-                elif self.map.is_in_bounds((y,x)) and noise[y][x] < self.OCEAN_BEACH_BOUND:
-                    self.map.set_cell_biome((y,x), CellType.beach.value)
+        water_cells = beach_cells = 0
+        bands = self.noise_gen.ocean_noise_bands(self.OCEAN_NOISE_FREQ, self.OCEAN_NOISE_DIST, self.map.band_rows(),
+                                                 octaves=self.NOISE_OCTAVES, lacunarity=self.NOISE_LACUNARITY,
+                                                 persistence=self.NOISE_PERSISTENCE, upsample=self.NOISE_UPSAMPLE)
+        for window, noise in bands:
+            in_bounds = self.map.create_circular_mask(window)
+            
+            water = in_bounds & (noise < self.OCEAN_WATER_BOUND)
+            beach = in_bounds & ~water & (noise < self.OCEAN_BEACH_BOUND)
+            origin = (window[0].start, window[1].start)
+            self.map.set_biome_where(water, CellType.water.value, origin)
+            self.map.set_biome_where(beach, CellType.beach.value, origin)
+            water_cells += int(water.sum())
+            beach_cells += int(beach.sum())
+        
+        self.pipeline.record(water_cells=water_cells, beach_cells=beach_cells, **self.noise_cache_counts())
                     
     
     def generate_lakes(self):
         """Generate lakes using a Perlin noise function
         """
-        noise = self.noise_gen.lake_noise(self.LAKE_NOISE_FREQ)
-        
-        for y in range(len(noise)):
-            for x in range(len(noise[y])):
-                if noise[y][x] < self.LAKE_WATER_BOUND:
-                    if not self.map.close_to_biome((y,x), CellType.traderoute.value, self.LAKE_TRADE_DIST):
-                        self.map.set_cell_biome((y,x), CellType.water.value)
+        water_cells = 0
+        bands = self.noise_gen.lake_noise_bands(self.LAKE_NOISE_FREQ, self.map.band_rows(),
+                                                octaves=self.NOISE_OCTAVES, lacunarity=self.NOISE_LACUNARITY,
+                                                persistence=self.NOISE_PERSISTENCE, upsample=self.NOISE_UPSAMPLE)
+        route_distance = self.map.biome_distance(CellType.traderoute.value)
+        for window, noise in bands:
+            near_route = route_distance[window] <= self.LAKE_TRADE_DIST
+            water = (noise < self.LAKE_WATER_BOUND) & ~near_route
+            self.map.set_biome_where(water, CellType.water.value, (window[0].start, window[1].start))
+            water_cells += int((water & self.map.create_circular_mask(window)).sum())
+        
+        self.pipeline.record(water_cells=water_cells, **self.noise_cache_counts())
+    
+    
+    def noise_cache_counts(self):
+        """Get the noise cache hits and misses of the noise generator, for the terrain stage metrics
+
+        Returns:
+            dict: Hit and miss counts, empty without a noise cache
+        """
+        if self.noise_gen.cache is None:
+            return {}
+        return {"noise_cache_hits": self.noise_gen.cache_hits, "noise_cache_misses": self.noise_gen.cache_misses}
     
     
     def generate_fish(self):
         """Generate fish and whales using Poisson Disc
         """
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.FISH_MIN_DIST_DIV)
+        rand = self.stage_rand("fish")
+        coordinates = self.get_samples("fish")
+        no_fish = no_whales = 0
         
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
             if self.map.get_cell_biome(coord) == CellType.water.value:
-                if self.rand.rand() < self.FISH_WHALE_CHANCE:
+                if rand.rand() < self.FISH_WHALE_CHANCE:
                     biome = CellType.fish.value
+                    no_fish += 1
                 else:
                     biome = CellType.whale.value
+                    no_whales += 1
                 self.map.place_fish(coord, biome)
         
+        self.pipeline.record(samples=len(coordinates), fish=no_fish, whales=no_whales, rejected=len(coordinates) - no_fish - no_whales)
+        
     
     def generate_trade_route(self):
         """Generate a trade route with trade posts.
@@ -230,48 +488,60 @@ class MapGenerator:
         Returns:
             list: List of trade post coordinates.
         """
+        rand = self.stage_rand("trade_route")
+        
         # Get two border points to act as begin and end
         coordinates1 = self.map.get_viable_border_cells()
-        rand_coord1 = coordinates1[self.rand.randint(0, len(coordinates1))]
-        coordinates2 = [coord for coord in coordinates1 if dist(rand_coord1, coord) > self.size/2]
-        rand_coord2 = coordinates2[self.rand.randint(0, len(coordinates2))]
+        rand_coord1 = tuple(coordinates1[rand.randint(0, len(coordinates1))].tolist())
+        coordinates2 = coordinates1[distances(coordinates1, [rand_coord1])[:, 0] > self.size/2]
+        rand_coord2 = tuple(coordinates2[rand.randint(0, len(coordinates2))].tolist())
         
         trade_coords = [rand_coord1, rand_coord2]
         
         # Place more points between these and connect them
         for _ in range(self.TRADE_NO_POINTS):
-            start = self.rand.randint(0, len(trade_coords)-1)
+            start = rand.randint(0, len(trade_coords)-1)
             middle = midpoint(trade_coords[start], trade_coords[start+1])
-            middle[0] += self.rand.randint(-self.TRADE_RANDOMNESS, self.TRADE_RANDOMNESS)
-            middle[1] += self.rand.randint(-self.TRADE_RANDOMNESS, self.TRADE_RANDOMNESS)
+            middle[0] += rand.randint(-self.TRADE_RANDOMNESS, self.TRADE_RANDOMNESS)
+            middle[1] += rand.randint(-self.TRADE_RANDOMNESS, self.TRADE_RANDOMNESS)
             trade_coords.insert(start+1, middle)
         
         # Draw the route on the map
-        for i in range(len(trade_coords) -1):
-            self.map.draw_trade_route(trade_coords[i], trade_coords[i+1])
+        route_coords = self.map.draw_trade_route(trade_coords)
+        self.pipeline.record(route_cells=len(route_coords))
             
         # Generate trade posts
-        return self.generate_trade_posts()
+        return self.generate_trade_posts(route_coords, rand)
     
     
-    def generate_trade_posts(self):
+    def generate_trade_posts(self, route_coords, rand):
         """Generate trade posts along the trade route.
 
+        Args:
+            route_coords (np.ndarray): Array of shape (N, 2) with trade route cells
+            rand (np.random.RandomState): Random object of the trade route stage
+
         Returns:
             list: List of trade post coordinates.
         """
         trade_post_pos = []
-        no_posts = self.rand.randint(self.TRADE_MIN_POSTS,self.TRADE_MAX_POSTS+1)
-            
-        route_coords = self.map.get_biome_coords(CellType.traderoute.value)
+        no_posts = rand.randint(self.TRADE_MIN_POSTS,self.TRADE_MAX_POSTS+1)
+        
+        # Distance of every route cell to the closest trade post placed so far
+        min_dist = np.full(len(route_coords), np.inf)
         for _ in range(no_posts):
-            rand_coord = route_coords[self.rand.randint(0, len(route_coords))]
+            # Only consider points with enough distance
+            candidates = np.flatnonzero(min_dist > self.size/self.TRADE_MIN_DIST_DIV)
+            if len(candidates) == 0:
+                break
+            
+            rand_coord = tuple(route_coords[candidates[rand.randint(0, len(candidates))]].tolist())
             self.map.place_placement(rand_coord, Status.TP)
             trade_post_pos.append(rand_coord)
             
-            # Only consider points with enough distance
-            route_coords = [coord for post_coord in trade_post_pos for coord in route_coords if dist(coord, post_coord) > self.size/self.TRADE_MIN_DIST_DIV]
+            np.minimum(min_dist, distances(route_coords, [rand_coord])[:, 0], out=min_dist)
         
+        self.pipeline.record(trade_posts=len(trade_post_pos))
         return trade_post_pos  
     
     
@@ -281,18 +551,20 @@ class MapGenerator:
         Returns:
             list: List of native locations
         """
+        rand = self.stage_rand("natives")
         native_pos = []
-        no_natives = self.rand.randint(self.NATIVE_MIN_POSTS, self.NATIVE_MAX_POSTS+1)
+        no_natives = rand.randint(self.NATIVE_MIN_POSTS, self.NATIVE_MAX_POSTS+1)
         
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.NATIVE_MIN_DIST_DIV)
+        coordinates = self.get_samples("natives")
         
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
           
             if self.map.get_cell_status(coord) == Status.EMPTY and not self.map.close_to_placement(coord, self.size/self.NATIVE_MIN_DIST_PLACE_DIV):
                 native_pos.append(coord)
        
         
-        native_pos = np.array(native_pos)[self.rand.choice(len(native_pos), no_natives, replace=False)]
+        self.pipeline.record(samples=len(coordinates), candidates=len(native_pos), placed=no_natives, rejected=len(coordinates) - len(native_pos))
+        native_pos = np.array(native_pos)[rand.choice(len(native_pos), no_natives, replace=False)]
             
         return native_pos
         
@@ -304,34 +576,49 @@ class MapGenerator:
             list: List of gold mine locations
         """
         gold_pos = []
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.GOLD_MIN_DIST_DIV)
+        coordinates = self.get_samples("gold")
         
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
             if self.map.get_cell_status(coord) == Status.EMPTY and not self.map.close_to_placement(coord, self.size/self.GOLD_MIN_DIST_PLACE_DIV):
                 self.map.place_placement(coord, Status.GOLD)
                 gold_pos.append(coord)
-                
+        
+        self.pipeline.record(samples=len(coordinates), placed=len(gold_pos), rejected=len(coordinates) - len(gold_pos))
         return gold_pos
     
     
     def generate_forest(self):
         """Generate forests using Poisson Disc sampling
         """
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.FOREST_MIN_DIST_DIV)
+        rand = self.stage_rand("forest")
+        coordinates = self.get_samples("forest")
+        placed = 0
         
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
             if self.map.get_cell_status(coord) == Status.EMPTY:
-                self.map.place_forest(coord)
+                self.map.place_forest(coord, rand)
+                placed += 1
+        
+        self.pipeline.record(samples=len(coordinates), placed=placed, rejected=len(coordinates) - placed)
                             
                             
     def generate_hunts(self):
         """Generate hunts using Poisson Disc sampling
+
+        Returns:
+            list: Hunt middle coordinates
         """
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.HUNT_MIN_DIST_DIV)
+        rand = self.stage_rand("hunts")
+        coordinates = self.get_samples("hunts")
+        hunt_pos = []
       
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
             if self.map.get_cell_status(coord) == Status.EMPTY:
-                self.map.place_hunt(coord)
+                self.map.place_hunt(coord, rand)
+                hunt_pos.append(coord)
+        
+        self.pipeline.record(samples=len(coordinates), placed=len(hunt_pos), rejected=len(coordinates) - len(hunt_pos))
+        return hunt_pos
     
     
     def generate_treasures(self):
@@ -341,13 +628,14 @@ class MapGenerator:
             list: List of treasure positions
         """
         treasure_pos = []
-        coordinates = self.noise_gen.poisson_disc_samples(r=self.size/self.TREASURE_MIN_DIST_DIV)
+        coordinates = self.get_samples("treasures")
         
-        for coord in coordinates:
+        for coord in map(tuple, coordinates.tolist()):
             if self.map.get_cell_status(coord) == Status.EMPTY and not self.map.close_to_placement(coord, self.size/self.TREASURE_MIN_DIST_PLACE_DIV):
                 self.map.place_placement(coord, Status.TREASURE)
                 treasure_pos.append(coord)
-                
+        
+        self.pipeline.record(samples=len(coordinates), placed=len(treasure_pos), rejected=len(coordinates) - len(treasure_pos))
         return treasure_pos
     
     
@@ -356,34 +644,79 @@ class MapGenerator:
 
         Returns:
             list: List of towncenter locations
-            list: List of goldmine locations
+            list: List of starting goldmine locations
+            list: List of starting hunt locations
         """
+        rand = self.stage_rand("tc")
         tc_pos = []
         gold_pos = []
+        hunt_pos = []
         
-        coordinates = self.map.get_viable_cells(self.size/self.TC_MIN_DIST_DIST_PLACE_DIV)
-        rand_coord = coordinates[self.rand.randint(0, len(coordinates))]
+        # Viable cells are kept as a mask, listing them all takes too much memory on large maps
+        viable = self.map.get_viable_mask(self.size/self.TC_MIN_DIST_DIST_PLACE_DIV)
+        no_viable = int(np.count_nonzero(viable))
+        self.pipeline.record(viable_cells=no_viable)
+        rand_coord = self.map.nth_cell(viable, rand.randint(0, no_viable))
         tc_pos.append(rand_coord)
-        gold_pos.append(self.map.place_tc(tuple(rand_coord)))
+        gold_coord, hunt_coord = self.map.place_tc(rand_coord, rand)
+        gold_pos.append(gold_coord)
+        hunt_pos.append(hunt_coord)
         
         for i in range(1, self.TC_NO):
-            coordinates = [coord for coord in coordinates if dist(coord, tc_pos[i-1]) >= self.size/self.TC_MIN_DIST_DIV]
-            rand_coord = coordinates[self.rand.randint(0, len(coordinates))]
+            self.map.mask_close_cells(viable, tc_pos[i-1], self.size/self.TC_MIN_DIST_DIV)
+            rand_coord = self.map.nth_cell(viable, rand.randint(0, int(np.count_nonzero(viable))))
             tc_pos.append(rand_coord)
-            gold_pos.append(self.map.place_tc(tuple(rand_coord)))
+            gold_coord, hunt_coord = self.map.place_tc(rand_coord, rand)
+            gold_pos.append(gold_coord)
+            hunt_pos.append(hunt_coord)
         
-        return tc_pos, gold_pos
+        return tc_pos, gold_pos, hunt_pos
     
     
-    def paste_icon(self, image, icon, pos):
+    def paste_icon(self, image, icon, pos, origin=(0, 0)):
         """Paste icon onto an image
 
         Args:
             image (PIL.Image): Image to paste on
             icon (PIL.Image): Icon to paste
-            pos (tuple): Location to paste on the image
+            pos (tuple): Location to paste on the map
+            origin (tuple, optional): Map location of the top left image pixel. Defaults to (0, 0).
         """
-        image.paste(icon, (int(pos[1] - icon.size[1]/2), int(pos[0] - icon.size[0]/2)), icon)
+        box = (int(pos[1] - icon.size[1]/2) - origin[1], int(pos[0] - icon.size[0]/2) - origin[0])
+        if box[1] >= image.size[1] or box[1] + icon.size[1] <= 0:
+            return
+        image.paste(icon, box, icon)
+    
+    
+    def palettize(self, image):
+        """Convert an RGBA map image to a palettized (P mode) image. Biome colors keep their
+        biome id as palette index. The most common remaining (icon) colors fill the rest of
+        the palette, other colors are mapped to the nearest palette entry.
+
+        Args:
+            image (PIL.Image): RGBA map image
+
+        Returns:
+            PIL.Image: Palettized map image
+        """
+        values = np.ascontiguousarray(np.asarray(image))
+        colors, inverse, counts = np.unique(values.view(np.uint32).ravel(), return_inverse=True, return_counts=True)
+        
+        # Fill the palette with biome colors first, then the most common other colors
+        palette = get_palette().view(np.uint32).ravel()
+        other = ~np.isin(colors, palette)
+        other_colors = colors[other][np.argsort(-counts[other], kind="stable")]
+        palette = np.concatenate([palette, other_colors[:256 - len(palette)]])
+        
+        # Map every color to its nearest palette entry
+        color_values = colors.view(np.uint8).reshape(-1, 4).astype(np.int64)
+        palette_values = palette.view(np.uint8).reshape(-1, 4)
+        dists = ((color_values[:, np.newaxis, :] - palette_values[np.newaxis, :, :])**2).sum(axis=2)
+        indices = dists.argmin(axis=1).astype(np.uint8)[inverse]
+        
+        palettized = Image.frombytes("P", image.size, indices.tobytes())
+        palettized.putpalette(palette_values.tobytes(), rawmode="RGBA")
+        return palettized
     
     
     def paste_compass(self, image):
@@ -395,11 +728,28 @@ class MapGenerator:
         Returns:
             PIL.Image: Image including the compass border
         """
-        compass = self.icons.get_compass(self.size)
+        compass = self.get_icons().get_compass(self.size)
         offset = (compass.size[0] - image.size[0]) // 2, (compass.size[1] - image.size[1]) // 2
         compass.paste(image, offset, image)
         return compass
         
     
         
-        
\ No newline at end of file
+        
+
+
+def stage_samples(size, r, seed, stage_index):
+    """Generate the Poisson Disc samples of a stage. The random stream is a child of the stage
+    stream, so samples do not depend on the other draws of the stage.
+
+    Args:
+        size (int): Map size
+        r (float): Minimum distance between samples
+        seed (int): Map seed
+        stage_index (int): Index of the stage in MapGenerator.STAGES
+
+    Returns:
+        np.ndarray: Array of shape (N, 2) with samples
+    """
+    seed_seq = np.random.SeedSequence(seed, spawn_key=(stage_index, 0))
+    return poisson_disc_samples(size, r, rand=np.random.RandomState(np.random.PCG64(seed_seq)))
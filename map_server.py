@@ -0,0 +1,251 @@
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+class MapServer(ThreadingHTTPServer):
+    """HTTP server generating maps on a pool of warm worker processes.
+    Finished maps are kept in an in-memory LRU, identical requests in flight share one job, and
+    requests are rejected once too many jobs are pending.
+    """
+
+    """
+    Constants
+    """
+    MAP_TYPES = ("random", "island", "land")
+    BIOMES = ("random", "snow", "plains", "andes", "decan")
+    FORMATS = ("png", "json")
+    MIN_SIZE = 100
+    MAX_SIZE = 2048
+    daemon_threads = True
+
+    def __init__(self, address, executor, job, defaults, workers, max_pending, lru_size):
+        """Initializer
+
+        Args:
+            address (tuple): (host, port) to listen on
+            executor (concurrent.futures.Executor): Executor running the jobs
+            job (callable): Job function called with a parameter dict, returns PNG bytes or a placements dict
+            defaults (dict): Default map parameters
+            workers (int): Number of workers of the executor
+            max_pending (int): Maximum number of queued and running jobs
+            lru_size (int): Maximum number of maps kept in memory
+        """
+        super().__init__(address, MapRequestHandler)
+        self.executor = executor
+        self.job = job
+        self.defaults = defaults
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "lru_hits": 0,
+            "lru_misses": 0,
+            "rejected": 0,
+            "errors": 0,
+            "jobs_done": 0,
+            "job_time": 0.0,
+        }
+        self.pending = 0
+
+    def parse_params(self, query):
+        """Parse map parameters from a query string, missing parameters take the server defaults
+
+        Args:
+            query (str): URL query string
+
+        Raises:
+            ValueError: If a parameter is invalid
+
+        Returns:
+            dict: Map parameters
+        """
+        values = {key: value[-1] for key, value in parse_qs(query).items()}
+        params = dict(self.defaults)
+        if "seed" in values:
+            params["seed"] = int(values["seed"])
+        if "size" in values:
+            params["size"] = int(values["size"])
+        for key in ("type", "biome", "format"):
+            params[key] = values.get(key, params[key])
+        for key in ("compass", "palette"):
+            if key in values:
+                params[key] = values[key].lower() in ("1", "true", "yes")
+
+        if params["seed"] is None:
+            params["seed"] = int(np.random.randint(0, 10000000))
+        if params["seed"] < 0:
+            raise ValueError("seed must not be negative")
+        if not self.MIN_SIZE <= params["size"] <= self.MAX_SIZE:
+            raise ValueError("size must be between {} and {}".format(self.MIN_SIZE, self.MAX_SIZE))
+        for key, choices in (("type", self.MAP_TYPES), ("biome", self.BIOMES), ("format", self.FORMATS)):
+            if params[key] not in choices:
+                raise ValueError("{} must be one of {}".format(key, ", ".join(choices)))
+        return params
+
+    def get_map(self, params):
+        """Get a map from the LRU or generate it on the executor
+
+        Args:
+            params (dict): Map parameters
+
+        Raises:
+            OverflowError: If too many jobs are pending
+
+        Returns:
+            bytes or dict: PNG data or placements
+        """
+        key = tuple(sorted(params.items()))
+        submitted = False
+        with self.lock:
+            self.stats["requests"] += 1
+            future = self.lru.get(key)
+            if future is not None:
+                self.lru.move_to_end(key)
+                self.stats["lru_hits"] += 1
+            elif self.pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise OverflowError("Too many pending maps")
+            else:
+                self.stats["lru_misses"] += 1
+                future = self.executor.submit(timed_job, self.job, params)
+                self.pending += 1
+                submitted = True
+                self.lru[key] = future
+                while len(self.lru) > self.lru_size:
+                    self.lru.popitem(last=False)
+
+        # Outside the lock, as the callback runs right away if the job is already done
+        if submitted:
+            future.add_done_callback(lambda f: self.job_done(key, f))
+        return future.result()[0]
+
+    def job_done(self, key, future):
+        """Update the statistics of a finished job and drop failed jobs from the LRU
+
+        Args:
+            key (tuple): LRU key of the job
+            future (concurrent.futures.Future): Finished job
+        """
+        with self.lock:
+            self.pending -= 1
+            if future.exception() is not None:
+                self.stats["errors"] += 1
+                if self.lru.get(key) is future:
+                    del self.lru[key]
+            else:
+                self.stats["jobs_done"] += 1
+                self.stats["job_time"] += future.result()[1]
+
+    def get_metrics(self):
+        """Get the server metrics
+
+        Returns:
+            dict: Request counts, queue depth and LRU usage
+        """
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics.update({
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "running": min(self.pending, self.workers),
+                "queue_depth": max(self.pending - self.workers, 0),
+                "lru_entries": len(self.lru),
+                "lru_size": self.lru_size,
+            })
+        return metrics
+
+
+def timed_job(job, params):
+    """Run a job and measure its duration
+
+    Args:
+        job (callable): Job function
+        params (dict): Map parameters
+
+    Returns:
+        Any: Job result
+        float: Job duration in seconds
+    """
+    start = perf_counter()
+    result = job(params)
+    return result, perf_counter() - start
+
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    """Request handler of the map server.
+    GET /map?seed=&size=&type=&biome=&compass=&palette=&format= returns a PNG image or JSON placements,
+    GET /metrics returns the server metrics as JSON.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self.send_json(200, self.server.get_metrics())
+        elif url.path == "/map":
+            self.send_map(url.query)
+        else:
+            self.send_json(404, {"error": "Unknown path {}".format(url.path)})
+
+    def send_map(self, query):
+        """Generate a map and send it
+
+        Args:
+            query (str): URL query string with the map parameters
+        """
+        try:
+            params = self.server.parse_params(query)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            result = self.server.get_map(params)
+        except OverflowError as e:
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": repr(e)})
+            return
+
+        headers = {"X-Map-Seed": str(params["seed"])}
+        if params["format"] == "png":
+            self.send_data(200, "image/png", result, headers)
+        else:
+            self.send_json(200, result, headers)
+
+    def send_json(self, code, data, headers=None):
+        """Send a JSON response
+
+        Args:
+            code (int): HTTP status code
+            data (dict): Response data
+            headers (dict, optional): Extra headers. Defaults to None.
+        """
+        self.send_data(code, "application/json", json.dumps(data).encode(), headers)
+
+    def send_data(self, code, content_type, data, headers=None):
+        """Send a response
+
+        Args:
+            code (int): HTTP status code
+            content_type (str): Content type of data
+            data (bytes): Response body
+            headers (dict, optional): Extra headers. Defaults to None.
+        """
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,126 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class NoiseCache:
+    """Cache of full map noise fields, keyed by (kind, Perlin permutation seed, frequency, distance factor, map size,
+    fBm parameters, backend).
+    Recently used fields are kept in memory up to a maximum number of bytes. With a path set, fields are also
+    stored as .npy files, which are memory mapped when read. Fields too large for memory are only stored on disk.
+    """
+
+    def __init__(self, max_bytes=256*1024**2, path=None):
+        """Initializer
+
+        Args:
+            max_bytes (int, optional): Maximum total size of the fields kept in memory. Defaults to 256 MiB.
+            path (str, optional): Directory to store fields in as .npy files. Defaults to None.
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self.fields = OrderedDict()
+        self.nbytes = 0
+        self.computing = {}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def file_path(self, key):
+        """Get the path of the .npy file of a field
+
+        Args:
+            key (tuple): Field key
+
+        Returns:
+            str: File path
+        """
+        return os.path.join(self.path, hashlib.sha256(repr(key).encode()).hexdigest() + ".npy")
+
+    def get(self, key):
+        """Get a cached field
+
+        Args:
+            key (tuple): Field key
+
+        Returns:
+            np.ndarray: Field, memory mapped if read from disk. None on a miss.
+        """
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+
+        if self.path is not None and os.path.exists(self.file_path(key)):
+            return np.load(self.file_path(key), mmap_mode="r")
+        return None
+
+    def allocate(self, key, shape):
+        """Allocate an array to compute a field into, in memory if it fits or else in a temporary file.
+        The cache owns the array until the field is stored with put or dropped with discard.
+
+        Args:
+            key (tuple): Field key
+            shape (tuple): Field shape
+
+        Returns:
+            bool: Whether the field can be cached
+        """
+        if np.prod(shape) * np.dtype(np.float64).itemsize <= self.max_bytes:
+            self.computing[key] = np.empty(shape, dtype=np.float64)
+        elif self.path is not None:
+            tmp_path = "{}.{}.tmp".format(self.file_path(key), os.getpid())
+            self.computing[key] = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=shape)
+        return key in self.computing
+
+    def write(self, key, window, values):
+        """Write part of a field from allocate
+
+        Args:
+            key (tuple): Field key
+            window (tuple): Pair of slices selecting the part
+            values (np.ndarray): Computed values of the part
+        """
+        self.computing[key][window] = values
+
+    def put(self, key):
+        """Store a field from allocate once it is fully computed
+
+        Args:
+            key (tuple): Field key
+        """
+        field = self.computing.pop(key)
+        if isinstance(field, np.memmap):
+            # Files can not be renamed while mapped on Windows, dropping the only reference unmaps it
+            tmp_path = field.filename
+            field.flush()
+            del field
+            os.replace(tmp_path, self.file_path(key))
+            return
+
+        if self.path is not None:
+            # Write to a temporary file first so other processes never read partial fields
+            tmp_path = "{}.{}.tmp".format(self.file_path(key), os.getpid())
+            with open(tmp_path, "wb") as f:
+                np.save(f, field)
+            os.replace(tmp_path, self.file_path(key))
+
+        if key in self.fields:
+            self.nbytes -= self.fields.pop(key).nbytes
+        self.fields[key] = field
+        self.nbytes += field.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.fields.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def discard(self, key):
+        """Drop a field from allocate that was not fully computed
+
+        Args:
+            key (tuple): Field key
+        """
+        field = self.computing.pop(key, None)
+        if isinstance(field, np.memmap):
+            tmp_path = field.filename
+            del field
+            os.remove(tmp_path)
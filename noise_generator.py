@@ -1,4 +1,4 @@
-from math import ceil, cos, floor, pi, sin, sqrt
+from math import ceil, floor, pi, sqrt
 
 import numpy as np
 
@@ -10,133 +10,436 @@ class NoiseGenerator:
     """Noise generation class
     """
     
-    def __init__(self, size, rand):
+    """
+    Constants
+    """
+    FBM_SAMPLES_PER_UNIT = 8
+    
+    def __init__(self, size, rand, cache=None):
         """Initializer
 
         Args:
             size (int): Map size
             rand (np.random.RandomState): Numpy random object
+            cache (NoiseCache, optional): Cache of noise fields shared between generators. Defaults to None.
         """
         self.size = size
         self.rand = rand
         #self.gen = OpenSimplex(seed=self.rand.randint(0, 100000))
-        self.gen = Perlin(self.rand.randint(0, 100000))
+        self.perm_seed = self.rand.randint(0, 100000)
+        self.gen = Perlin(self.perm_seed)
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
     
     
-    def noise(self, nx, ny):
-        """Convert [-1, 1] noise to [0,1]
+    def noise(self, nx, ny, octaves=1, lacunarity=2.0, persistence=0.5):
+        """Convert [-1, 1] noise to [0,1]. With multiple octaves, fractal Brownian motion (fBm) noise is generated:
+        every octave adds noise of lacunarity times the frequency and persistence times the amplitude of the previous one.
 
         Args:
             nx (float): x coord
             ny (float): y coord
+            octaves (int, optional): Number of octaves. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
 
         Returns:
             float: Noise value
         """
-        return self.gen.noise2d(nx, ny) / 2.0 + 0.5
+        if octaves == 1:
+            return self.gen.noise2d(nx, ny) / 2.0 + 0.5
+        
+        value = total_amplitude = 0.0
+        for freq, amplitude in self.octave_scales(octaves, lacunarity, persistence):
+            value += amplitude * self.gen.noise2d(freq*nx, freq*ny)
+            total_amplitude += amplitude
+        return value / total_amplitude / 2.0 + 0.5
+    
+    
+    def noise_grid(self, nx, ny, octaves=1, lacunarity=2.0, persistence=0.5, upsample=True):
+        """Convert [-1, 1] noise to [0,1] for a whole grid of coordinates, see noise.
+        The samples of all octaves are evaluated in one batched call. The base octave is always evaluated exactly,
+        so adding octaves only adds detail. With upsample set, higher octaves with a frequency low enough to need
+        fewer samples than the grid has are sampled on a coarser lattice and bilinearly upsampled.
+
+        Args:
+            nx (np.ndarray): 1D array of increasing x coords
+            ny (np.ndarray): 1D array of increasing y coords
+            octaves (int, optional): Number of octaves. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
+            upsample (bool, optional): Whether to upsample low frequency octaves, or evaluate every octave exactly. Defaults to True.
+
+        Returns:
+            np.ndarray: Noise values of shape (len(ny), len(nx))
+        """
+        if octaves == 1:
+            return self.gen.noise2d_grid(nx, ny) / 2.0 + 0.5
+        
+        nx = np.asarray(nx, dtype=np.float64)
+        ny = np.asarray(ny, dtype=np.float64)
+        
+        # Sample coordinates of every octave
+        octave_grids = []
+        for i, (freq, amplitude) in enumerate(self.octave_scales(octaves, lacunarity, persistence)):
+            if upsample and i > 0:
+                xs, ys = self.octave_axis(nx, freq), self.octave_axis(ny, freq)
+            else:
+                xs, ys = nx, ny
+            octave_grids.append((freq, amplitude, xs, ys))
+        
+        # Evaluate all octaves at once
+        x = np.concatenate([np.broadcast_to(freq*xs, (len(ys), len(xs))).ravel() for freq, _, xs, ys in octave_grids])
+        y = np.concatenate([np.broadcast_to((freq*ys)[:, np.newaxis], (len(ys), len(xs))).ravel() for freq, _, xs, ys in octave_grids])
+        samples = self.gen.noise2d_array(x, y)
+        
+        value = np.zeros((len(ny), len(nx)))
+        start = 0
+        for _, amplitude, xs, ys in octave_grids:
+            octave = samples[start:start + len(xs)*len(ys)].reshape(len(ys), len(xs))
+            start += len(xs)*len(ys)
+            octave = self.upsample(octave, ys, ny, axis=0)
+            octave = self.upsample(octave, xs, nx, axis=1)
+            value += amplitude * octave
+        
+        total_amplitude = sum(amplitude for _, amplitude, _, _ in octave_grids)
+        return value / total_amplitude / 2.0 + 0.5
+    
+    
+    def octave_scales(self, octaves, lacunarity, persistence):
+        """Get the frequency and amplitude of every fBm octave
+
+        Args:
+            octaves (int): Number of octaves
+            lacunarity (float): Frequency multiplier per octave
+            persistence (float): Amplitude multiplier per octave
+
+        Returns:
+            list: (frequency, amplitude) tuple per octave
+        """
+        return [(lacunarity**i, persistence**i) for i in range(octaves)]
     
     
-    def lake_noise(self, freq=1.0):
+    def octave_axis(self, coords, freq):
+        """Get the sample coordinates of an octave along one axis. Low frequency octaves are sampled on a
+        lattice of FBM_SAMPLES_PER_UNIT points per noise unit. The lattice is fixed in noise space, so
+        separately generated windows of a map get the same values.
+
+        Args:
+            coords (np.ndarray): 1D array of increasing coordinates
+            freq (float): Octave frequency
+
+        Returns:
+            np.ndarray: 1D array of sample coordinates, coords itself if the lattice is not coarser
+        """
+        step = 1 / (freq * self.FBM_SAMPLES_PER_UNIT)
+        first, last = int(floor(coords[0] / step)), int(ceil(coords[-1] / step))
+        if last - first + 1 >= len(coords):
+            return coords
+        return np.arange(first, last + 1) * step
+    
+    
+    def upsample(self, values, coarse, fine, axis):
+        """Linearly interpolate sampled values to other coordinates along one axis
+
+        Args:
+            values (np.ndarray): 2D array of samples
+            coarse (np.ndarray): 1D array of increasing sample coordinates along axis
+            fine (np.ndarray): 1D array of coordinates to interpolate at, within the sample coordinates
+            axis (int): Axis to interpolate along
+
+        Returns:
+            np.ndarray: 2D array with len(fine) entries along axis
+        """
+        if coarse is fine:
+            return values
+        
+        idx = np.clip(np.searchsorted(coarse, fine, side="right") - 1, 0, len(coarse) - 2)
+        weight = (fine - coarse[idx]) / (coarse[idx + 1] - coarse[idx])
+        if axis == 0:
+            weight = weight[:, np.newaxis]
+        low = values.take(idx, axis=axis)
+        high = values.take(idx + 1, axis=axis)
+        return low + (high - low) * weight
+    
+    
+    def axis_coords(self):
+        """Get the normalized [-0.5, 0.5) coordinates of the map pixels along one axis
+
+        Returns:
+            np.ndarray: 1D array of coordinates
+        """
+        return np.arange(self.size) / self.size - 0.5
+    
+    
+    def lake_noise(self, freq=1.0, window=None, octaves=1, lacunarity=2.0, persistence=0.5, upsample=True):
         """Generate Perlin noise for lakes
 
         Args:
             freq (float, optional): Frequency. Defaults to 1.0.
+            window (tuple, optional): Pair of slices selecting the part of the map to generate. Defaults to the whole map.
+            octaves (int, optional): Number of fBm octaves, see noise. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
+            upsample (bool, optional): Whether to upsample low frequency octaves, see noise_grid. Defaults to True.
 
         Returns:
-            list: List of lists containing noise values
+            np.ndarray: Array of shape (size, size), or the window shape, containing noise values
         """
-        values = []
-        for y in range(self.size):
-            values.append([0] * self.size)
-            for x in range(self.size):
-                nx = x/self.size - 0.5
-                ny = y/self.size - 0.5
-                
-                value = self.noise(freq*nx, freq*ny)
-                values[y][x] = value
-                
-        return values
-    
-    
-    def ocean_noise(self, freq=1.0, dist=1.0):
+        xs, ys = self.window_coords(window)
+        return self.noise_grid(freq*xs, freq*ys, octaves, lacunarity, persistence, upsample)
+    
+    
+    def ocean_noise(self, freq=1.0, dist=1.0, window=None, octaves=1, lacunarity=2.0, persistence=0.5, upsample=True):
         """Generate Perlin noise for ocean
 
         Args:
             freq (float, optional): Frequency. Defaults to 1.0.
             dist (float, optional): Distance factor. Defaults to 1.0.
+            window (tuple, optional): Pair of slices selecting the part of the map to generate. Defaults to the whole map.
+            octaves (int, optional): Number of fBm octaves, see noise. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
+            upsample (bool, optional): Whether to upsample low frequency octaves, see noise_grid. Defaults to True.
 
         Returns:
-            list: List of lists containing noise values
+            np.ndarray: Array of shape (size, size), or the window shape, containing noise values
         """
-        values = []
-        for y in range(self.size):
-            values.append([0] * self.size)
-            for x in range(self.size):
-                nx = x/self.size - 0.5
-                ny = y/self.size - 0.5
-                d = sqrt(nx*nx + ny*ny) / sqrt(0.5) * dist
-                value = self.noise(freq*nx, freq*ny)
-                values[y][x] = (1 + value - d) / 2
-                
-        return values
+        xs, ys = self.window_coords(window)
+        nx = xs[np.newaxis, :]
+        ny = ys[:, np.newaxis]
+        d = np.sqrt(nx*nx + ny*ny) / sqrt(0.5) * dist
+        value = self.noise_grid(freq*xs, freq*ys, octaves, lacunarity, persistence, upsample)
+        return (1 + value - d) / 2
     
     
+    def lake_noise_bands(self, freq=1.0, band_rows=None, vectorized=True, octaves=1, lacunarity=2.0, persistence=0.5,
+                         upsample=True):
+        """Generate Perlin noise for lakes one row band at a time, so only one band is in memory
+
+        Args:
+            freq (float, optional): Frequency. Defaults to 1.0.
+            band_rows (int, optional): Number of rows per band. Defaults to the whole map as one band.
+            vectorized (bool, optional): Whether to evaluate whole bands with numpy, or every cell with the
+                scalar noise function. Both give the same values, unless the vectorized backend upsamples
+                low frequency octaves. Defaults to True.
+            octaves (int, optional): Number of fBm octaves, see noise. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
+            upsample (bool, optional): Whether the vectorized backend upsamples low frequency octaves, see noise_grid. Defaults to True.
+
+        Yields:
+            tuple: Pair of slices selecting the band
+            np.ndarray: Array of shape (rows, size) containing noise values
+        """
+        def compute(window):
+            if vectorized:
+                return self.lake_noise(freq, window, *fbm, upsample)
+            xs, ys = self.window_coords(window)
+            return np.array([[self.noise(freq*x, freq*y, *fbm) for x in xs.tolist()] for y in ys.tolist()])
+        
+        fbm = (octaves, lacunarity, persistence)
+        key = ("lake", self.perm_seed, freq, None, self.size, fbm, vectorized, upsample)
+        return self.cached_bands(key, band_rows, compute)
     
+    
+    def ocean_noise_bands(self, freq=1.0, dist=1.0, band_rows=None, vectorized=True, octaves=1, lacunarity=2.0, persistence=0.5,
+                          upsample=True):
+        """Generate Perlin noise for ocean one row band at a time, so only one band is in memory
+
+        Args:
+            freq (float, optional): Frequency. Defaults to 1.0.
+            dist (float, optional): Distance factor. Defaults to 1.0.
+            band_rows (int, optional): Number of rows per band. Defaults to the whole map as one band.
+            vectorized (bool, optional): Whether to evaluate whole bands with numpy, or every cell with the
+                scalar noise function. Both give the same values, unless the vectorized backend upsamples
+                low frequency octaves. Defaults to True.
+            octaves (int, optional): Number of fBm octaves, see noise. Defaults to 1.
+            lacunarity (float, optional): Frequency multiplier per octave. Defaults to 2.0.
+            persistence (float, optional): Amplitude multiplier per octave. Defaults to 0.5.
+            upsample (bool, optional): Whether the vectorized backend upsamples low frequency octaves, see noise_grid. Defaults to True.
+
+        Yields:
+            tuple: Pair of slices selecting the band
+            np.ndarray: Array of shape (rows, size) containing noise values
+        """
+        def compute(window):
+            if vectorized:
+                return self.ocean_noise(freq, dist, window, *fbm, upsample)
+            xs, ys = self.window_coords(window)
+            return np.array([[(1 + self.noise(freq*x, freq*y, *fbm) - sqrt(x*x + y*y) / sqrt(0.5) * dist) / 2
+                              for x in xs.tolist()] for y in ys.tolist()])
+        
+        fbm = (octaves, lacunarity, persistence)
+        key = ("ocean", self.perm_seed, freq, dist, self.size, fbm, vectorized, upsample)
+        return self.cached_bands(key, band_rows, compute)
+    
+    
+    def cached_bands(self, key, band_rows, compute):
+        """Yield the row bands of a noise field from the cache, or compute them and store the field in the cache
+
+        Args:
+            key (tuple): Cache key of the field
+            band_rows (int): Number of rows per band, the whole map as one band if None
+            compute (callable): Function computing the noise of a window
+
+        Yields:
+            tuple: Pair of slices selecting the band
+            np.ndarray: Array of shape (rows, size) containing noise values
+        """
+        if self.cache is None:
+            for window in self.band_windows(band_rows):
+                yield window, compute(window)
+            return
+        
+        field = self.cache.get(key)
+        if field is not None:
+            self.cache_hits += 1
+            for window in self.band_windows(band_rows):
+                yield window, np.asarray(field[window])
+            return
+        
+        self.cache_misses += 1
+        cacheable = self.cache.allocate(key, (self.size, self.size))
+        complete = False
+        try:
+            for window in self.band_windows(band_rows):
+                noise = compute(window)
+                if cacheable:
+                    self.cache.write(key, window, noise)
+                yield window, noise
+            complete = True
+        finally:
+            if cacheable:
+                if complete:
+                    self.cache.put(key)
+                else:
+                    self.cache.discard(key)
+    
+    
+    def band_windows(self, band_rows=None):
+        """Iterate over the map in full width row bands
+
+        Args:
+            band_rows (int, optional): Number of rows per band. Defaults to the whole map as one band.
+
+        Yields:
+            tuple: Pair of slices selecting the band
+        """
+        band_rows = band_rows or self.size
+        for y in range(0, self.size, band_rows):
+            yield np.s_[y:min(y + band_rows, self.size), 0:self.size]
+    
+    
+    def window_coords(self, window=None):
+        """Get the normalized coordinates of the map pixels in a window
 
+        Args:
+            window (tuple, optional): Pair of slices selecting part of the map. Defaults to the whole map.
 
-    def poisson_disc_samples(self, r, k=10):
-        """ Generate random samples for current image size using Poisson Disk sampling
-        Inspired by: https://github.com/emulbreh/bridson
+        Returns:
+            np.ndarray: 1D array of x coordinates
+            np.ndarray: 1D array of y coordinates
+        """
+        coords = self.axis_coords()
+        if window is None:
+            return coords, coords
+        return coords[window[1]], coords[window[0]]
+    
+    
+    
+
+
+    def poisson_disc_samples(self, r, k=10, rand=None):
+        """Generate random samples for current image size using Poisson Disk sampling, see poisson_disc_samples
 
         Args:
             r (float): Minimum distance between samples
             k (int, optional): Number of attempts for points to be placed. Defaults to 10.
+            rand (np.random.RandomState, optional): Random object to draw from. Defaults to self.rand.
 
         Returns:
-            list: List of generated samples
+            np.ndarray: Array of shape (N, 2) with generated samples
         """
-        tau = 2 * pi
-        cellsize = r / sqrt(2)
-
-        grid_size = int(ceil(self.size / cellsize))
-        grid = [None] * (grid_size * grid_size)
-
-        def grid_coords(p):
-            return int(floor(p[0] / cellsize)), int(floor(p[1] / cellsize))
-
-        def fits(p, gx, gy):
-            yrange = list(range(max(gy - 2, 0), min(gy + 3, grid_size)))
-            for x in range(max(gx - 2, 0), min(gx + 3, grid_size)):
-                for y in yrange:
-                    g = grid[x + y * grid_size]
-                    if g is None:
-                        continue
-                    if dist(p, g) <= r:
-                        return False
-            return True
-
-        p = int(self.size * self.rand.rand()), int(self.size * self.rand.rand())
-        queue = [p]
+        return poisson_disc_samples(self.size, r, k, rand if rand is not None else self.rand)
+
+
+def poisson_disc_samples(size, r, k=10, rand=np.random):
+    """ Generate random samples for a square image using Poisson Disk sampling
+    Inspired by: https://github.com/emulbreh/bridson
+    
+    The background grid is an integer array holding indices into the sample array. The k
+    candidates of an active point are drawn in one batch and tested against its grid
+    neighbourhood at once. Random numbers are consumed in the same order as the original
+    scalar implementation, so a seeded generator reproduces its sample sets.
+
+    Args:
+        size (int): Image size
+        r (float): Minimum distance between samples
+        k (int, optional): Number of attempts for points to be placed. Defaults to 10.
+        rand (np.random.RandomState, optional): Random object to draw from. Defaults to the global numpy random state.
+
+    Returns:
+        np.ndarray: Array of shape (N, 2) with generated samples
+    """
+    tau = 2 * pi
+    cellsize = r / sqrt(2)
+
+    grid_size = int(ceil(size / cellsize))
+    grid = np.full((grid_size, grid_size), -1, dtype=np.int64)
+    points = np.zeros((grid_size * grid_size, 2), dtype=np.int64)
+    no_points = 0
+    
+    # Candidates lie within 2r of their active point, so every sample within r of a
+    # candidate lies inside this many grid cells of the active point
+    reach = int(ceil(2 * r / cellsize)) + 2
+
+    def grid_coords(p):
+        return int(floor(p[0] / cellsize)), int(floor(p[1] / cellsize))
+    
+    def add(p):
+        nonlocal no_points
         grid_x, grid_y = grid_coords(p)
-        grid[grid_x + grid_y * grid_size] = p
-
-        while queue:
-            qi = int(self.rand.rand() * len(queue))
-            qx, qy = queue[qi]
-            queue[qi] = queue[-1]
-            queue.pop()
-            for _ in range(k):
-                alpha = tau * self.rand.rand()
-                d = r * sqrt(3 * self.rand.rand() + 1)
-                px = int(qx + d * cos(alpha))
-                py = int(qy + d * sin(alpha))
-                if not (0 <= px < self.size and 0 <= py < self.size):
-                    continue
-                p = (px, py)
-                grid_x, grid_y = grid_coords(p)
-                if not fits(p, grid_x, grid_y):
-                    continue
-                queue.append(p)
-                grid[grid_x + grid_y * grid_size] = p
-                
-        return [p for p in grid if p is not None]
+        points[no_points] = p
+        grid[grid_y, grid_x] = no_points
+        no_points += 1
+
+    p = int(size * rand.rand()), int(size * rand.rand())
+    queue = [p]
+    add(p)
+
+    while queue:
+        qi = int(rand.rand() * len(queue))
+        qx, qy = queue[qi]
+        queue[qi] = queue[-1]
+        queue.pop()
+        
+        # Draw all k candidates in one batch
+        draws = rand.rand(k, 2)
+        alpha = tau * draws[:, 0]
+        d = r * np.sqrt(3 * draws[:, 1] + 1)
+        px = (qx + d * np.cos(alpha)).astype(np.int64)
+        py = (qy + d * np.sin(alpha)).astype(np.int64)
+        
+        # Test all candidates against the samples around the active point
+        grid_x, grid_y = grid_coords((qx, qy))
+        window = grid[max(grid_y - reach, 0):grid_y + reach + 1, max(grid_x - reach, 0):grid_x + reach + 1]
+        neighbours = points[window[window >= 0]]
+        dx = px[:, np.newaxis] - neighbours[:, 0]
+        dy = py[:, np.newaxis] - neighbours[:, 1]
+        fits = ~(np.sqrt(dx*dx + dy*dy) <= r).any(axis=1)
+        fits &= (px >= 0) & (px < size) & (py >= 0) & (py < size)
+        
+        # Candidates accepted earlier in this batch also block later ones
+        accepted = []
+        for p in zip(px[fits].tolist(), py[fits].tolist()):
+            if any(dist(p, a) <= r for a in accepted):
+                continue
+            accepted.append(p)
+            queue.append(p)
+            add(p)
+    
+    # Return samples in grid order
+    idx = grid.ravel()
+    return points[idx[idx >= 0]]
@@ -1,6 +1,8 @@
 from math import sqrt, floor
 from ctypes import c_int64
 
+import numpy as np
+
 
 def overflow(x):
     """Enables python int overflow for perm generation
@@ -41,6 +43,8 @@ class Perlin:
             seed (int): Random seed
         """
         self.perm = self.get_perm(seed)
+        self.perm_array = np.array(self.perm, dtype=np.int64)
+        self.gradients_array = np.array(self.GRADIENTS, dtype=np.int64)
         
       
     def get_perm(self, seed):
@@ -192,4 +196,146 @@ class Perlin:
             attn_ext *= attn_ext
             value += attn_ext * attn_ext * self.extrapolate(xsv_ext, ysv_ext, dx_ext, dy_ext)
 
-        return value / self.NORM_CONSTANT
\ No newline at end of file
+        return value / self.NORM_CONSTANT
+    
+    def extrapolate_grid(self, xsb, ysb, dx, dy):
+        """Vectorized version of extrapolate for arrays of grid coordinates
+
+        Args:
+            xsb (np.ndarray): Grid x coordinates
+            ysb (np.ndarray): Grid y coordinates
+            dx (np.ndarray): Distances to grid in x-axis
+            dy (np.ndarray): Distances to grid in y-axis
+
+        Returns:
+            np.ndarray: extrapolated values
+        """
+        perm = self.perm_array
+        index = perm[(perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+        
+        return self.gradients_array[index] * dx + self.gradients_array[index + 1] * dy
+    
+    def contribution_grid(self, xsb, ysb, dx, dy):
+        """Attenuated contribution of a lattice vertex for arrays of coordinates
+
+        Args:
+            xsb (np.ndarray): Grid x coordinates of the vertex
+            ysb (np.ndarray): Grid y coordinates of the vertex
+            dx (np.ndarray): Distances to the vertex in x-axis
+            dy (np.ndarray): Distances to the vertex in y-axis
+
+        Returns:
+            np.ndarray: Contribution values, 0 where the vertex is out of reach
+        """
+        attn = 2 - dx * dx - dy * dy
+        attn = np.where(attn > 0, attn, 0)
+        attn *= attn
+        return attn * attn * self.extrapolate_grid(xsb, ysb, dx, dy)
+    
+    def noise2d_grid(self, xs, ys):
+        """Generate 2d OpenSimplex noise for a whole grid of coordinates at once.
+        Matches noise2d evaluated at every (x, y) combination.
+
+        Args:
+            xs (np.ndarray): 1D array of x coordinates
+            ys (np.ndarray): 1D array of y coordinates
+
+        Returns:
+            np.ndarray: Array of shape (len(ys), len(xs)) with noise values between -1 and +1
+        """
+        x, y = np.meshgrid(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+        return self.noise2d_array(x, y)
+    
+    def noise2d_array(self, x, y):
+        """Generate 2d OpenSimplex noise for arrays of coordinates at once.
+        Matches noise2d evaluated at every (x[i], y[i]) pair.
+
+        Args:
+            x (np.ndarray): Array of x coordinates
+            y (np.ndarray): Array of y coordinates, same shape as x
+
+        Returns:
+            np.ndarray: Array of the shape of x with noise values between -1 and +1
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        
+        # Place input coordinates onto grid.
+        stretch_offset = (x + y) * self.STRETCH_CONSTANT
+        xs = x + stretch_offset
+        ys = y + stretch_offset
+
+        # Floor to get grid coordinates of rhombus (stretched square) super-cell origin.
+        xsb = np.floor(xs).astype(np.int64)
+        ysb = np.floor(ys).astype(np.int64)
+
+        # Skew out to get actual coordinates of rhombus origin.
+        squish_offset = (xsb + ysb) * self.SQUISH_CONSTANT
+        xb = xsb + squish_offset
+        yb = ysb + squish_offset
+
+        # Compute grid coordinates relative to rhombus origin.
+        xins = xs - xsb
+        yins = ys - ysb
+
+        # Sum those together to get a value that determines which region we're in.
+        in_sum = xins + yins
+
+        # Positions relative to origin point.
+        dx0 = x - xb
+        dy0 = y - yb
+
+        # Contribution (1,0)
+        dx1 = dx0 - 1 - self.SQUISH_CONSTANT
+        dy1 = dy0 - 0 - self.SQUISH_CONSTANT
+        value = self.contribution_grid(xsb + 1, ysb + 0, dx1, dy1)
+
+        # Contribution (0,1)
+        dx2 = dx0 - 0 - self.SQUISH_CONSTANT
+        dy2 = dy0 - 1 - self.SQUISH_CONSTANT
+        value += self.contribution_grid(xsb + 0, ysb + 1, dx2, dy2)
+
+        # Region masks: triangle at (0,0) or (1,1), and whether (0,0)/(1,1) is one of the closest vertices
+        lower = in_sum <= 1
+        zins = np.where(lower, 1 - in_sum, 2 - in_sum)
+        closest = np.where(lower, (zins > xins) | (zins > yins), (zins < xins) | (zins < yins))
+        x_side = xins > yins
+        regions = [
+            lower & closest & x_side,
+            lower & closest & ~x_side,
+            lower & ~closest,
+            ~lower & closest & x_side,
+            ~lower & closest & ~x_side,
+        ]
+        
+        # Extra vertex for every region, the last entry is the default (~lower & ~closest)
+        xsv_ext = np.select(regions, [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb + 0], xsb)
+        ysv_ext = np.select(regions, [ysb - 1, ysb + 1, ysb + 1, ysb + 0, ysb + 2], ysb)
+        dx_ext = np.select(regions, [
+            dx0 - 1,
+            dx0 + 1,
+            dx0 - 1 - 2 * self.SQUISH_CONSTANT,
+            dx0 - 2 - 2 * self.SQUISH_CONSTANT,
+            dx0 + 0 - 2 * self.SQUISH_CONSTANT,
+        ], dx0)
+        dy_ext = np.select(regions, [
+            dy0 + 1,
+            dy0 - 1,
+            dy0 - 1 - 2 * self.SQUISH_CONSTANT,
+            dy0 + 0 - 2 * self.SQUISH_CONSTANT,
+            dy0 - 2 - 2 * self.SQUISH_CONSTANT,
+        ], dy0)
+        
+        # Move origin to (1,1) inside the upper triangle
+        xsb = np.where(lower, xsb, xsb + 1)
+        ysb = np.where(lower, ysb, ysb + 1)
+        dx0 = np.where(lower, dx0, dx0 - 1 - 2 * self.SQUISH_CONSTANT)
+        dy0 = np.where(lower, dy0, dy0 - 1 - 2 * self.SQUISH_CONSTANT)
+
+        # Contribution (0,0) or (1,1)
+        value += self.contribution_grid(xsb, ysb, dx0, dy0)
+
+        # Extra Vertex
+        value += self.contribution_grid(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+        return value / self.NORM_CONSTANT
@@ -0,0 +1,131 @@
+import time
+import tracemalloc
+
+
+class Stage:
+    """Named generation stage
+    """
+
+    def __init__(self, name, label, func):
+        """Initializer
+
+        Args:
+            name (str): Stage name used in metrics
+            label (str): Human readable stage name
+            func (callable): Function running the stage, called without arguments
+        """
+        self.name = name
+        self.label = label
+        self.func = func
+
+
+class StageHook:
+    """Hook interface called around every generation stage. Subclasses override the callbacks they need.
+    """
+
+    def stage_started(self, stage):
+        """Called before a stage runs
+
+        Args:
+            stage (Stage): Stage about to run
+        """
+        pass
+
+    def stage_finished(self, stage, metrics):
+        """Called after a stage has run
+
+        Args:
+            stage (Stage): Finished stage
+            metrics (dict): Metrics of the stage run
+        """
+        pass
+
+
+class PrintHook(StageHook):
+    """Hook printing generation progress
+    """
+
+    def stage_started(self, stage):
+        print("Generating {}...".format(stage.label))
+
+    def stage_finished(self, stage, metrics):
+        if metrics["counts"]:
+            print("  " + ", ".join("{}: {}".format(key, value) for key, value in metrics["counts"].items()))
+
+
+class MetricsHook(StageHook):
+    """Hook collecting the metrics of all stages
+    """
+
+    def __init__(self):
+        """Initializer
+        """
+        self.metrics = []
+
+    def stage_finished(self, stage, metrics):
+        self.metrics.append(metrics)
+
+    def pop_metrics(self):
+        """Get the collected metrics and start a new collection
+
+        Returns:
+            list: Metrics of all stages run since the last call
+        """
+        metrics, self.metrics = self.metrics, []
+        return metrics
+
+
+class Pipeline:
+    """Runs generation stages, measuring wall time, CPU time and peak memory of each stage.
+    Peak memory is only measured while tracemalloc is tracing.
+    """
+
+    def __init__(self, hooks=None):
+        """Initializer
+
+        Args:
+            hooks (list, optional): List of StageHook objects. Defaults to None.
+        """
+        self.hooks = hooks if hooks is not None else []
+        self.counts = None
+
+    def record(self, **counts):
+        """Record output counts of the running stage, e.g. number of forests placed. Ignored outside a stage.
+        """
+        if self.counts is not None:
+            self.counts.update(counts)
+
+    def run(self, stage):
+        """Run a stage
+
+        Args:
+            stage (Stage): Stage to run
+
+        Returns:
+            Any: Return value of the stage function
+        """
+        for hook in self.hooks:
+            hook.stage_started(stage)
+
+        self.counts = {}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+
+        result = stage.func()
+
+        metrics = {
+            "stage": stage.name,
+            "wall_time": time.perf_counter() - start_wall,
+            "cpu_time": time.process_time() - start_cpu,
+            "peak_memory": tracemalloc.get_traced_memory()[1] - start_memory if tracing else None,
+            "counts": self.counts,
+        }
+        self.counts = None
+
+        for hook in self.hooks:
+            hook.stage_finished(stage, metrics)
+        return result
@@ -0,0 +1,129 @@
+from math import ceil
+
+import numpy as np
+
+
+class PlacementIndex:
+    """Spatial index for placements on the map.
+    For every queried radius a boolean raster marks the cells within that radius of any
+    placement. Rasters are built once per radius and updated for every new placement,
+    so distance queries become array lookups. Without rasterization, queries are
+    answered from the placement coordinates, keeping memory use independent of the map size.
+    """
+
+    def __init__(self, size, rasterize=True):
+        """Initializer
+
+        Args:
+            size (int): Size of the map
+            rasterize (bool, optional): Whether to keep a raster per queried radius. Defaults to True.
+        """
+        self.size = size
+        self.rasterize = rasterize
+        self.placements = np.zeros((0, 2), dtype=np.int64)
+        self.masks = {}
+
+
+    def add(self, pos):
+        """Add a placement to the index
+
+        Args:
+            pos (tuple): Coordinate of placement
+        """
+        self.placements = np.concatenate([self.placements, [pos]]).astype(np.int64)
+        for (r, inclusive), mask in self.masks.items():
+            self.stamp(mask, pos, r, inclusive)
+
+
+    def stamp(self, mask, pos, r, inclusive, origin=(0, 0)):
+        """Mark all cells within r of pos in mask
+
+        Args:
+            mask (np.ndarray): Boolean raster to update
+            pos (tuple): Coordinate of placement
+            r (float): Radius
+            inclusive (bool): Whether cells at exactly distance r are marked
+            origin (tuple, optional): Map coordinate of the first raster cell. Defaults to (0, 0).
+        """
+        reach = int(ceil(r))
+        y0, y1 = max(pos[0] - reach, origin[0]), min(pos[0] + reach + 1, origin[0] + mask.shape[0])
+        x0, x1 = max(pos[1] - reach, origin[1]), min(pos[1] + reach + 1, origin[1] + mask.shape[1])
+        if y0 >= y1 or x0 >= x1:
+            return
+
+        dy = np.arange(y0, y1)[:, np.newaxis] - pos[0]
+        dx = np.arange(x0, x1)[np.newaxis, :] - pos[1]
+        dists = np.sqrt(dy*dy + dx*dx)
+        mask[y0 - origin[0]:y1 - origin[0], x0 - origin[1]:x1 - origin[1]] |= dists <= r if inclusive else dists < r
+
+
+    def near_mask(self, r, inclusive=False, window=None):
+        """Get the raster of cells within r of any placement
+
+        Args:
+            r (float): Radius
+            inclusive (bool, optional): Whether cells at exactly distance r count as near. Defaults to False.
+            window (tuple, optional): Pair of slices selecting the part of the map to get. Defaults to the whole map.
+
+        Returns:
+            np.ndarray: Boolean array of the window
+        """
+        if window is None:
+            window = np.s_[0:self.size, 0:self.size]
+        
+        if not self.rasterize:
+            mask = np.zeros((window[0].stop - window[0].start, window[1].stop - window[1].start), dtype=bool)
+            for pos in self.placements.tolist():
+                self.stamp(mask, pos, r, inclusive, (window[0].start, window[1].start))
+            return mask
+        
+        key = (r, inclusive)
+        if key not in self.masks:
+            mask = np.zeros((self.size, self.size), dtype=bool)
+            for pos in self.placements.tolist():
+                self.stamp(mask, pos, r, inclusive)
+            self.masks[key] = mask
+
+        return self.masks[key][window]
+
+
+    def any_within(self, positions, r):
+        """Check for a batch of positions whether any placement is closer than r
+
+        Args:
+            positions (np.ndarray): Array of shape (N, 2) with coordinates
+            r (float): Distance
+
+        Returns:
+            np.ndarray: Boolean array of shape (N,)
+        """
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        result = np.zeros(len(positions), dtype=bool)
+        if self.rasterize:
+            inside = ((positions >= 0) & (positions < self.size)).all(axis=1)
+            mask = self.near_mask(r)
+            result[inside] = mask[positions[inside, 0], positions[inside, 1]]
+        else:
+            inside = np.zeros(len(positions), dtype=bool)
+
+        # Positions off the map, or all positions without rasters, are compared against the placements directly
+        outside = positions[~inside]
+        if len(outside) and len(self.placements):
+            dy = outside[:, np.newaxis, 0] - self.placements[:, 0]
+            dx = outside[:, np.newaxis, 1] - self.placements[:, 1]
+            result[~inside] = (np.sqrt(dy*dy + dx*dx) < r).any(axis=1)
+
+        return result
+
+
+    def far_mask(self, r, window=None):
+        """Get the raster of cells further than r from every placement
+
+        Args:
+            r (float): Distance
+            window (tuple, optional): Pair of slices selecting the part of the map to get. Defaults to the whole map.
+
+        Returns:
+            np.ndarray: Boolean array of the window
+        """
+        return ~self.near_mask(r, inclusive=True, window=window)
@@ -0,0 +1,88 @@
+import struct
+import zlib
+
+import numpy as np
+
+
+class PNGWriter:
+    """Writes an RGBA PNG image band by band, so the whole image never has to be in memory
+    """
+
+    """
+    Constants
+    """
+    SIGNATURE = b"\x89PNG\r\n\x1a\n"
+    COLOR_TYPE_RGBA = 6
+    FILTER_SUB = 1
+
+    def __init__(self, path, width, height, compress_level=6):
+        """Initializer
+
+        Args:
+            path (str): Output file path
+            width (int): Image width
+            height (int): Image height
+            compress_level (int, optional): zlib compression level. Defaults to 6.
+        """
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compress_level)
+        self.file = open(path, "wb")
+        self.file.write(self.SIGNATURE)
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, self.COLOR_TYPE_RGBA, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_chunk(self, chunk_type, data):
+        """Write a PNG chunk
+
+        Args:
+            chunk_type (bytes): Four letter chunk type
+            data (bytes): Chunk data
+        """
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, rows):
+        """Append image rows
+
+        Args:
+            rows (np.ndarray): uint8 array of shape (N, width, 4)
+        """
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        if rows.shape[1] != self.width * 4 or self.rows_written + len(rows) > self.height:
+            raise ValueError("Rows do not fit the image")
+
+        # Sub filter: store the difference to the pixel on the left, which is zero in flat map areas
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = self.FILTER_SUB
+        filtered[:, 1:5] = rows[:, :4]
+        np.subtract(rows[:, 4:], rows[:, :-4], out=filtered[:, 5:])
+
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self.write_chunk(b"IDAT", data)
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Finish the image and close the file
+        """
+        if self.file.closed:
+            return
+        try:
+            self.write_chunk(b"IDAT", self.compressor.flush())
+            self.write_chunk(b"IEND", b"")
+        finally:
+            self.file.close()
+        if self.rows_written != self.height:
+            raise ValueError("Image has {} of {} rows".format(self.rows_written, self.height))
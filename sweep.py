@@ -0,0 +1,142 @@
+import itertools
+
+from PIL import Image, ImageDraw
+
+from analysis import MapAnalyzer
+from map_generator import MapGenerator
+from noise_cache import NoiseCache
+from pipeline import MetricsHook
+
+
+class ParameterSweep:
+    """Generates maps for every combination of MapGenerator constant overrides.
+    All combinations of a seed share a noise cache, so every unique noise field is computed once and
+    only thresholded again per combination.
+    """
+
+    """
+    Constants
+    """
+    THUMB_SIZE = 150
+    LABEL_HEIGHT = 16
+    BACKGROUND = (255, 255, 255, 255)
+    TEXT_COLOR = (0, 0, 0, 255)
+
+    def __init__(self, overrides):
+        """Initializer
+
+        Args:
+            overrides (dict): Lists of values to try per MapGenerator constant name
+
+        Raises:
+            ValueError: If a name is not a MapGenerator constant
+        """
+        for name in overrides:
+            if not name.isupper() or not hasattr(MapGenerator, name):
+                raise ValueError("{} is not a MapGenerator constant".format(name))
+        self.overrides = overrides
+
+    def combinations(self):
+        """Get all override combinations
+
+        Returns:
+            list: List of dicts mapping constant names to values
+        """
+        names = list(self.overrides)
+        return [dict(zip(names, values)) for values in itertools.product(*self.overrides.values())]
+
+    def run_seed(self, seed, size, type_str=None, biome_str=None, icons=None, noise_cache=None, thumb_size=THUMB_SIZE):
+        """Generate the maps of all combinations for one seed
+
+        Args:
+            seed (int): Map seed
+            size (int): Map size
+            type_str (str, optional): Map type, randomly selected if None. Defaults to None.
+            biome_str (str, optional): Map biome, randomly selected if None. Defaults to None.
+            icons (IconLoader, optional): Loaded icons. Defaults to None.
+            noise_cache (NoiseCache, optional): Noise cache to use. Defaults to a new in-memory cache.
+            thumb_size (int, optional): Size of the returned thumbnails. Defaults to THUMB_SIZE.
+
+        Returns:
+            list: (thumbnail, metrics) tuple per combination, in combination order
+        """
+        if noise_cache is None:
+            noise_cache = NoiseCache()
+        analyzer = MapAnalyzer()
+
+        results = []
+        for index, params in enumerate(self.combinations()):
+            metrics_hook = MetricsHook()
+            map_generator = MapGenerator(size, seed, icons=icons, hooks=[metrics_hook], noise_cache=noise_cache)
+            for name, value in params.items():
+                setattr(map_generator, name, value)
+
+            generated = map_generator.generate_headless(type_str, biome_str)
+            thumbnail = map_generator.render(generated).resize((thumb_size, thumb_size), Image.LANCZOS)
+
+            results.append((thumbnail, {
+                "combination": index,
+                "params": params,
+                "seed": seed,
+                "size": size,
+                "stages": metrics_hook.pop_metrics(),
+                "balance": analyzer.balance_metrics(generated),
+            }))
+        return results
+
+    def contact_sheet(self, thumbnails, seeds):
+        """Arrange thumbnails in a grid with a row per combination and a column per seed
+
+        Args:
+            thumbnails (list): Per combination, a list of thumbnails in seed order
+            seeds (list): Map seeds
+
+        Returns:
+            PIL.Image: Contact sheet
+        """
+        thumb_size = thumbnails[0][0].size[0]
+        row_height = self.LABEL_HEIGHT + thumb_size
+        labels = [", ".join("{}={}".format(name, value) for name, value in params.items()) for params in self.combinations()]
+        
+        # Widen the sheet to fit the longest label
+        label_width = max(int(ImageDraw.Draw(Image.new("RGBA", (1, 1))).textlength(label)) + 4 for label in labels)
+        width = max(thumb_size * len(seeds), label_width)
+        sheet = Image.new("RGBA", (width, self.LABEL_HEIGHT + row_height * len(thumbnails)), self.BACKGROUND)
+        draw = ImageDraw.Draw(sheet)
+
+        for column, seed in enumerate(seeds):
+            draw.text((column * thumb_size + 2, 2), "seed {}".format(seed), fill=self.TEXT_COLOR)
+
+        for row, (label, row_thumbnails) in enumerate(zip(labels, thumbnails)):
+            top = self.LABEL_HEIGHT + row * row_height
+            draw.text((2, top + 2), label, fill=self.TEXT_COLOR)
+            for column, thumbnail in enumerate(row_thumbnails):
+                sheet.paste(thumbnail, (column * thumb_size, top + self.LABEL_HEIGHT), thumbnail)
+        return sheet
+
+
+def parse_overrides(specs):
+    """Parse NAME=V1,V2,... override specifications
+
+    Args:
+        specs (list): List of specification strings
+
+    Raises:
+        ValueError: If a specification is malformed
+
+    Returns:
+        dict: Lists of values per constant name
+    """
+    def parse_value(value):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    overrides = {}
+    for spec in specs:
+        name, sep, values = spec.partition("=")
+        if not sep or not values:
+            raise ValueError("Expected NAME=V1,V2,... but got {}".format(spec))
+        overrides[name.strip()] = [parse_value(value) for value in values.split(",")]
+    return overrides
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from map_cache import MapCache
+
+
+def write_bytes(size):
+    def write_image(path):
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+    return write_image
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = MapCache(str(tmp_path), max_size=300)
+    keys = [cache.key(seed, 200, "island", "plains", False, False) for seed in range(3)]
+    for i, key in enumerate(keys):
+        cache.store(key, write_bytes(100))
+        os.utime(cache.image_path(key), (1000 + i, 1000 + i))
+
+    # Reading the oldest entry makes the second one the least recently used
+    assert cache.get(keys[0]) == cache.image_path(keys[0])
+    new_key = cache.key(3, 200, "island", "plains", False, False)
+    cache.store(new_key, write_bytes(100))
+
+    assert cache.get(keys[1]) is None
+    for key in (keys[0], keys[2], new_key):
+        assert cache.get(key) == cache.image_path(key)
+
+
+def test_partially_written_entry_is_never_returned(tmp_path):
+    cache = MapCache(str(tmp_path))
+    key = cache.key(1, 200, "island", "plains", False, False)
+
+    def write_image(path):
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG")
+        assert cache.get(key) is None
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        cache.store(key, write_image)
+
+    assert cache.get(key) is None
+    assert not os.path.exists(cache.image_path(key))
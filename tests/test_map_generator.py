@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from map_generator import MapGenerator
+
+
+ICON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "icons")
+
+
+@pytest.mark.parametrize("type_str", ["island", "land"])
+def test_tiled_matches_untiled(tmp_path, type_str):
+    size, seed = 300, 5
+    map_generator = MapGenerator(size, seed, icon_path=ICON_PATH, hooks=[])
+    image = map_generator.generate(type_str, "plains")
+
+    tiled_generator = MapGenerator(size, seed, icon_path=ICON_PATH, hooks=[], tile_size=64, layer_dir=str(tmp_path))
+    path = str(tmp_path / "tiled.png")
+    tiled_generator.generate_file(path, type_str, "plains")
+
+    assert np.array_equal(tiled_generator.map.biome_layer, map_generator.map.biome_layer)
+    assert np.array_equal(tiled_generator.map.status_layer, map_generator.map.status_layer)
+    with Image.open(path) as tiled_image:
+        assert np.array_equal(np.asarray(tiled_image.convert("RGBA")), np.asarray(image))
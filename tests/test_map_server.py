@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from map_server import MapServer
+
+
+DEFAULTS = {
+    "seed": None,
+    "size": 200,
+    "type": "random",
+    "biome": "random",
+    "compass": False,
+    "palette": False,
+    "format": "json",
+}
+
+
+class BlockingJob:
+    """Job recording its calls, blocked until released
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, params):
+        self.calls.append(params)
+        self.started.set()
+        self.release.wait(5)
+        return {"seed": params["seed"]}
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(job, max_pending=8):
+        executor = ThreadPoolExecutor(2)
+        server = MapServer(("127.0.0.1", 0), executor, job, DEFAULTS, 2, max_pending, 16)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, executor))
+        return server
+
+    yield start
+    for server, executor in servers:
+        server.shutdown()
+        server.server_close()
+        executor.shutdown()
+
+
+def fetch(server, query):
+    url = "http://{}:{}/map?{}".format(*server.server_address[:2], query)
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_identical_requests_share_one_job(serve):
+    job = BlockingJob()
+    server = serve(job)
+
+    with ThreadPoolExecutor(2) as clients:
+        first = clients.submit(fetch, server, "seed=3")
+        assert job.started.wait(5)
+        second = clients.submit(fetch, server, "seed=3")
+        while server.get_metrics()["requests"] < 2:
+            time.sleep(0.01)
+        job.release.set()
+        results = [first.result(), second.result()]
+
+    assert results == [{"seed": 3}, {"seed": 3}]
+    assert len(job.calls) == 1
+    assert server.get_metrics()["lru_hits"] == 1
+
+
+def test_requests_over_max_pending_are_rejected(serve):
+    job = BlockingJob()
+    server = serve(job, max_pending=1)
+
+    with ThreadPoolExecutor(1) as clients:
+        first = clients.submit(fetch, server, "seed=3")
+        assert job.started.wait(5)
+        with pytest.raises(urllib.error.HTTPError) as e:
+            fetch(server, "seed=4")
+        job.release.set()
+        assert first.result() == {"seed": 3}
+
+    assert e.value.code == 503
+    assert e.value.headers["Retry-After"] == "1"
+    assert len(job.calls) == 1
+    assert server.get_metrics()["rejected"] == 1
+
+
+@pytest.mark.parametrize("query", ["size=50", "size=4096", "seed=-1", "type=moon"])
+def test_invalid_parameters_are_rejected(serve, query):
+    server = serve(BlockingJob())
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        fetch(server, query)
+
+    assert e.value.code == 400
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from noise_cache import NoiseCache
+from noise_generator import NoiseGenerator
+
+
+def test_field_too_large_for_memory_is_stored_on_disk(tmp_path):
+    cache = NoiseCache(max_bytes=1024, path=str(tmp_path))
+    noise_gen = NoiseGenerator(64, np.random.RandomState(0), cache=cache)
+
+    computed = np.vstack([noise for _, noise in noise_gen.lake_noise_bands(4.0, band_rows=16)])
+    cached = np.vstack([noise for _, noise in noise_gen.lake_noise_bands(4.0, band_rows=16)])
+
+    assert np.array_equal(cached, computed)
+    assert (noise_gen.cache_misses, noise_gen.cache_hits) == (1, 1)
+    assert not cache.computing
+    assert [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")] == []
+
+
+def test_partially_computed_field_is_discarded(tmp_path):
+    cache = NoiseCache(max_bytes=1024, path=str(tmp_path))
+    noise_gen = NoiseGenerator(64, np.random.RandomState(0), cache=cache)
+
+    bands = noise_gen.lake_noise_bands(4.0, band_rows=16)
+    next(bands)
+    bands.close()
+
+    assert not cache.computing
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,55 @@
+import numpy as np
+
+from noise_generator import NoiseGenerator
+
+
+# Samples of the original scalar sampler for size 120, r=15 and RandomState(7)
+RECORDED_SAMPLES = [
+    [23, 0], [39, 2], [96, 5], [4, 16], [33, 16], [71, 17], [110, 11], [16, 26], [52, 22], [83, 28],
+    [110, 28], [33, 33], [69, 37], [10, 44], [50, 47], [65, 52], [88, 51], [108, 46], [4, 63], [20, 59],
+    [35, 55], [40, 71], [67, 69], [98, 66], [115, 65], [2, 78], [25, 82], [81, 82], [9, 93], [41, 91],
+    [55, 85], [94, 90], [112, 85], [27, 101], [75, 100], [109, 103], [49, 108], [93, 108], [117, 116], [10, 117],
+]
+
+
+def test_poisson_disc_samples_match_recorded():
+    noise_gen = NoiseGenerator(120, np.random.RandomState(0))
+
+    samples = noise_gen.poisson_disc_samples(r=15, rand=np.random.RandomState(7))
+
+    assert samples.tolist() == RECORDED_SAMPLES
+
+
+def test_poisson_disc_samples_keep_distance():
+    r = 12
+    noise_gen = NoiseGenerator(200, np.random.RandomState(0))
+
+    samples = noise_gen.poisson_disc_samples(r=r, rand=np.random.RandomState(3))
+
+    delta = samples[:, np.newaxis, :] - samples[np.newaxis, :, :]
+    dists = np.sqrt((delta * delta).sum(axis=2))
+    dists[np.diag_indices(len(samples))] = np.inf
+    assert dists.min() > r
+    assert ((samples >= 0) & (samples < 200)).all()
+
+
+def test_noise_grid_without_upsampling_matches_scalar():
+    noise_gen = NoiseGenerator(64, np.random.RandomState(0))
+    xs = np.linspace(0.0, 3.0, 40)
+    ys = np.linspace(1.0, 2.5, 25)
+
+    grid = noise_gen.noise_grid(xs, ys, octaves=4, upsample=False)
+
+    expected = np.array([[noise_gen.noise(x, y, 4) for x in xs.tolist()] for y in ys.tolist()])
+    assert np.allclose(grid, expected)
+
+
+def test_noise_grid_upsampling_keeps_base_octave_exact():
+    noise_gen = NoiseGenerator(64, np.random.RandomState(0))
+    xs = np.linspace(0.0, 0.5, 200)
+    ys = np.linspace(0.0, 0.5, 150)
+
+    exact = noise_gen.noise_grid(xs, ys, octaves=2, persistence=0.0, upsample=False)
+    upsampled = noise_gen.noise_grid(xs, ys, octaves=2, persistence=0.0)
+
+    assert np.array_equal(upsampled, exact)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from perlin import Perlin
+
+
+@pytest.mark.parametrize("seed", [0, 1234, 99999])
+def test_noise2d_grid_matches_scalar(seed):
+    gen = Perlin(seed)
+    xs = np.linspace(-3.7, 5.2, 23)
+    ys = np.linspace(-1.1, 7.9, 17)
+
+    grid = gen.noise2d_grid(xs, ys)
+
+    expected = np.array([[gen.noise2d(x, y) for x in xs.tolist()] for y in ys.tolist()])
+    assert grid.shape == (len(ys), len(xs))
+    assert np.array_equal(grid, expected)
+
+
+@pytest.mark.parametrize("seed", [0, 1234, 99999])
+def test_noise2d_array_matches_scalar(seed):
+    gen = Perlin(seed)
+    rand = np.random.RandomState(seed)
+    x = rand.uniform(-10, 10, size=(7, 11))
+    y = rand.uniform(-10, 10, size=(7, 11))
+    # Lattice points and cell edges take the boundary branches
+    x[0, :4] = [0.0, 1.0, -2.0, 3.0]
+    y[0, :4] = [0.0, 1.0, 2.0, -3.0]
+
+    values = gen.noise2d_array(x, y)
+
+    expected = np.array([gen.noise2d(a, b) for a, b in zip(x.ravel().tolist(), y.ravel().tolist())]).reshape(x.shape)
+    assert np.array_equal(values, expected)
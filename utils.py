@@ -2,6 +2,8 @@ from math import sqrt
 import os
 import sys
 
+import numpy as np
+
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller
 
@@ -34,6 +36,19 @@ def dist(p1, p2):
     return sqrt( dy*dy + dx*dx )
 
 
+def distances(coords1, coords2):
+    """Calculate the distance matrix between two sets of coordinates
+
+    Args:
+        coords1 (np.ndarray): Array of shape (N, 2)
+        coords2 (np.ndarray): Array of shape (M, 2)
+
+    Returns:
+        np.ndarray: Array of shape (N, M) with distances
+    """
+    delta = np.asarray(coords1, dtype=float)[:, np.newaxis, :] - np.asarray(coords2)[np.newaxis, :, :]
+    return np.sqrt((delta * delta).sum(axis=2))
+
 
 def midpoint(p1, p2):
     """Get midpoint coordinate between two points
@@ -45,4 +60,49 @@ def midpoint(p1, p2):
     Returns:
         tuple: Midpoint coordinate
     """
-    return [int((p1[0] + p2[0])/2), int((p1[1] + p2[1])/2)]
\ No newline at end of file
+    return [int((p1[0] + p2[0])/2), int((p1[1] + p2[1])/2)]
+
+
+def chebyshev_distance_transform(mask, out=None):
+    """Calculate the chessboard (Chebyshev) distance from every cell to the nearest True cell.
+    Uses a two-pass chamfer scan, each row is processed as one array operation, so only a few rows
+    are held in memory besides the input and output.
+
+    Args:
+        mask (np.ndarray): 2D boolean array of feature cells
+        out (np.ndarray, optional): 2D int array to write the distances into, e.g. a memory mapped layer. Defaults to a new array.
+
+    Returns:
+        np.ndarray: 2D int array of distances. Cells are height + width if there are no features.
+    """
+    height, width = mask.shape
+    if out is None:
+        out = np.empty((height, width), dtype=np.int64)
+    xs = np.arange(width)
+    
+    def propagate(row, prev):
+        # Neighbours in the previous row
+        candidates = prev.copy()
+        candidates[1:] = np.minimum(candidates[1:], prev[:-1])
+        candidates[:-1] = np.minimum(candidates[:-1], prev[1:])
+        return np.minimum(row, candidates + 1)
+    
+    # Forward pass: top to bottom, left to right
+    prev = None
+    for y in range(height):
+        row = np.where(mask[y], 0, height + width)
+        if prev is not None:
+            row = propagate(row, prev)
+        prev = xs + np.minimum.accumulate(row - xs)
+        out[y] = prev
+    
+    # Backward pass: bottom to top, right to left
+    prev = None
+    for y in range(height-1, -1, -1):
+        row = np.asarray(out[y], dtype=np.int64)
+        if prev is not None:
+            row = propagate(row, prev)
+        prev = np.minimum.accumulate((row + xs)[::-1])[::-1] - xs
+        out[y] = prev
+    
+    return out